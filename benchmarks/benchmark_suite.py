@@ -0,0 +1,267 @@
+"""
+Measures the hot paths of the visualiser on a synthetic song (or any MIDI file) and saves the results as JSON,
+so that they can be compared against a baseline from an earlier version.
+
+    python benchmarks/benchmark_suite.py --save baseline.json
+    python benchmarks/benchmark_suite.py --compare baseline.json
+
+Everything runs with SDL's dummy video driver, so no window is opened.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPO_FOLDER = os.path.dirname(BENCHMARK_FOLDER)
+sys.path.insert(0, REPO_FOLDER)
+
+import midi_visualiser as mv
+import synthetic_midi
+
+# Results which are this much slower than the baseline are reported as regressions
+REGRESSION_THRESHOLD = 0.1
+
+# Importing midi_visualiser should take less than this many seconds, so that tools which import it stay quick
+IMPORT_TIME_BUDGET = 0.5
+
+# Modules which are only needed by some features, so importing midi_visualiser should not import them
+LAZY_MODULES = ["cv2", "ffmpeg", "idlelib", "midi", "pretty_midi", "tkinter"]
+
+DEFAULT_RESOLUTIONS = ["640x360", "1280x720", "1920x1080"]
+
+# Frames are drawn in this many runs of consecutive frames, so that the caches are used the way an export uses them
+FRAME_RUNS = 4
+
+
+def time_best(function, repeats):
+    """Returns the fastest of several runs in seconds."""
+    best_time = float("inf")
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        best_time = min(best_time, time.perf_counter() - start)
+    return best_time
+
+def create_app(config, width, height, **settings):
+    config = dict(config)
+    config.update(settings)
+    app = mv.Application(config, (width, height), headless=True)
+    app.song_cache = None # Every read should really parse the file
+    return app
+
+def get_frames(app, frame_count):
+    """Splits the frames into FRAME_RUNS runs of consecutive frames, which start at points spread evenly over the whole video."""
+    video_frames = app.render_engine.count_video_frames()
+    run_length = max(frame_count // FRAME_RUNS, 1)
+    frames = []
+    for run in range(FRAME_RUNS):
+        first_frame = max(video_frames - run_length, 0) * run // (FRAME_RUNS - 1)
+        frames += range(first_frame, first_frame + run_length)
+    return frames
+
+def benchmark_import(repeats):
+    """Times importing midi_visualiser in a new interpreter, which also shows which modules the import pulled in."""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import midi_visualiser\n"
+        "print(time.perf_counter() - start)\n"
+        "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))\n"
+    )
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+
+    best_time = float("inf")
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], cwd=REPO_FOLDER, env=env, capture_output=True, text=True, check=True).stdout
+        seconds, modules = output.splitlines()[-2:]
+        best_time = min(best_time, float(seconds))
+
+    lazy_modules_imported = [name for name in LAZY_MODULES if name in modules.split()]
+    return {"seconds": best_time, "lazy_modules_imported": len(lazy_modules_imported)}, lazy_modules_imported
+
+def check_import_budget(result, lazy_modules_imported, budget):
+    """Prints and returns the number of ways the import went over its budget."""
+    problems = 0
+    if result["seconds"] > budget:
+        print(f"Importing midi_visualiser took {result['seconds']:.3f} s, which is over the budget of {budget:.3f} s")
+        problems += 1
+    if lazy_modules_imported:
+        print(f"Importing midi_visualiser also imported {', '.join(lazy_modules_imported)}, which should only be imported when needed")
+        problems += 1
+    return problems
+
+def benchmark_parse(config, filename, repeats):
+    app = create_app(config, 640, 360)
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds = time_best(lambda: app.read_midi(filename), repeats)
+        song = app.read_midi(filename)
+    return {"seconds": seconds, "notes": len(song.notes), "notes_per_second": len(song.notes) / seconds}
+
+def benchmark_query(config, filename, frame_count):
+    """Times get_current_items_on_screen on its own, at the frames from get_frames."""
+    app = create_app(config, 1280, 720)
+    app.filename = filename
+    runner = app.render_engine
+    with contextlib.redirect_stdout(io.StringIO()):
+        runner.init_video()
+
+    frames = get_frames(app, frame_count)
+    notes_found = 0
+    start = time.perf_counter()
+    for frame in frames:
+        runner.set_frame_time(frame)
+        runner.exit_timestamp = app.time - runner.current_to_exit_time
+        runner.entry_timestamp = app.time + runner.entry_to_current_time
+        runner.get_current_items_on_screen()
+        notes_found += len(app.current_notes)
+    seconds = time.perf_counter() - start
+
+    return {"milliseconds_per_frame": seconds * 1000 / len(frames), "mean_notes_on_screen": notes_found / len(frames)}
+
+def benchmark_draw(config, filename, frame_count, visualisation, note_renderer, width, height):
+    """Times drawing whole frames (without saving them) for one visualisation and note renderer."""
+    app = create_app(config, width, height, visualisation=visualisation, note_renderer=note_renderer)
+    app.filename = filename
+    runner = app.render_engine
+    with contextlib.redirect_stdout(io.StringIO()):
+        runner.init_video()
+
+    frames = get_frames(app, frame_count)
+    start = time.perf_counter()
+    for frame in frames:
+        runner.set_frame_time(frame)
+        app.draw_bg()
+        runner.render_current_frame()
+    seconds = time.perf_counter() - start
+
+    return {"frames_per_second": len(frames) / seconds, "milliseconds_per_frame": seconds * 1000 / len(frames)}
+
+def benchmark_export(config, filename, width, height, seconds):
+    """Renders the first few seconds of the song to a video, including the encoding."""
+    app = create_app(config, width, height)
+    app.filename = filename
+    with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()):
+        video_path = os.path.join(folder, "benchmark.mp4")
+        app.render_engine.init_video()
+
+        # Only export part of the song, by moving where the song ends
+        app.song.end_time = min(app.song.end_time, seconds)
+        frame_count = app.render_engine.count_video_frames()
+
+        start = time.perf_counter()
+        app.render(filename, video_path)
+        elapsed = time.perf_counter() - start
+
+    return {"frames_per_second": frame_count / elapsed, "frames": frame_count}
+
+def compare_results(results, baseline):
+    """Prints every measurement which got slower than the baseline by more than REGRESSION_THRESHOLD."""
+    regressions = 0
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        for key, value in result.items():
+            old_value = baseline["results"][name].get(key)
+            if old_value is None or not old_value:
+                continue
+
+            # Times should go down and rates should go up
+            if key.endswith("per_second"):
+                change = old_value / value - 1
+            elif "seconds" in key:
+                change = value / old_value - 1
+            else:
+                continue
+
+            status = "REGRESSION" if change > REGRESSION_THRESHOLD else "ok"
+            regressions += status == "REGRESSION"
+            print(f"{status:<10} {name:<40} {key:<24} {old_value:>12.3f} -> {value:>12.3f} ({change:+.1%} slower)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing, note queries, drawing and exporting.")
+    parser.add_argument("--midi-file", help="Benchmark this file instead of a synthetic song.")
+    parser.add_argument("-c", "--config", default=os.path.join(REPO_FOLDER, "options.cfg"), help="The settings to benchmark with.")
+    parser.add_argument("--frames", type=int, default=300, help="Number of frames drawn for each visualisation, in runs of consecutive frames.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of times the file is parsed (the fastest time is kept).")
+    parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS, help="Sizes to export at, e.g. 1280x720.")
+    parser.add_argument("--export-seconds", type=float, default=10, help="How much of the song to export at each resolution.")
+    parser.add_argument("--skip-export", action="store_true", help="Do not run the export benchmarks, which need ffmpeg.")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_TIME_BUDGET, help="Most seconds that importing midi_visualiser may take.")
+    parser.add_argument("--save", help="Save the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare the results with a JSON file saved earlier.")
+    synthetic_midi.add_song_arguments(parser)
+    args = parser.parse_args()
+
+    config = mv.get_config(args.config)["DEFAULT"]
+    midi_file = os.path.abspath(args.midi_file) if args.midi_file else None
+    resolutions = [tuple(int(size) for size in resolution.split("x")) for resolution in args.resolutions]
+
+    # Relative paths in the settings (such as the chords file) are relative to the repository
+    os.chdir(REPO_FOLDER)
+
+    with tempfile.TemporaryDirectory() as folder:
+        if midi_file:
+            filename = midi_file
+            song = {"file": args.midi_file}
+        else:
+            filename = os.path.join(folder, "synthetic.mid")
+            synthetic_midi.generate_song_from_args(filename, args)
+            song = {key: value for key, value in vars(args).items() if key in [
+                "tracks", "notes_per_second", "seconds", "pitch_low", "pitch_high",
+                "length_distribution", "mean_length", "tempo_changes", "seed"]}
+
+        results = {}
+        print("Importing...")
+        results["import"], lazy_modules_imported = benchmark_import(args.repeats)
+        print("Parsing...")
+        results["parse"] = benchmark_parse(config, filename, args.repeats)
+        print("Finding the notes on screen...")
+        results["query"] = benchmark_query(config, filename, args.frames)
+
+        for visualisation in mv.VISUALISATION_NAME_DCT:
+            for note_renderer in mv.ConfigMenu.note_renderers:
+                print(f"Drawing {visualisation} with {note_renderer}...")
+                results[f"draw {visualisation} {note_renderer}"] = benchmark_draw(
+                    config, filename, args.frames, visualisation, note_renderer, 1280, 720)
+
+        if not args.skip_export:
+            for width, height in resolutions:
+                print(f"Exporting at {width}x{height}...")
+                results[f"export {width}x{height}"] = benchmark_export(config, filename, width, height, args.export_seconds)
+
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "song": song,
+        "results": results,
+    }
+
+    for name, result in results.items():
+        print(f"{name:<40} " + "  ".join(f"{key} {value:.3f}" for key, value in result.items()))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved the results to {args.save}")
+
+    regressions = check_import_budget(results["import"], lazy_modules_imported, args.import_budget)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["song"] != report["song"]:
+            print(f"Warning: {args.compare} was measured on a different song, so the results may not be comparable")
+        regressions += compare_results(report, baseline)
+    print(f"{regressions} regressions")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
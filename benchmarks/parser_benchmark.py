@@ -0,0 +1,48 @@
+"""
+Compares how long each MIDI parser backend takes to read the same files.
+
+    python benchmarks/parser_benchmark.py song.mid other_song.mid --repeats 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import midi_parser
+
+
+def time_backend(filename, backend, repeats, jobs=None):
+    """Returns the fastest time out of several reads, along with the number of notes found."""
+    best_time = float("inf")
+    for i in range(repeats):
+        # The backends print their pairing statistics, which would clutter the table
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            parsed = midi_parser.read_midi_file(filename, backend, jobs)
+            best_time = min(best_time, time.perf_counter() - start)
+    return best_time, len(parsed.notes)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the MIDI parser backends.")
+    parser.add_argument("midi_files", nargs="+", help="The MIDI files to read.")
+    parser.add_argument("-b", "--backends", nargs="+", default=list(midi_parser.BACKENDS.keys()), choices=list(midi_parser.BACKENDS.keys()))
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="How many times to read each file (the fastest time is kept).")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of processes for the Native backend (default: chosen from the file size).")
+    args = parser.parse_args()
+
+    print(f"{'File':<30} {'Backend':<12} {'Notes':>8} {'Time (ms)':>10} {'Notes/s':>12}")
+    for filename in args.midi_files:
+        for backend in args.backends:
+            try:
+                best_time, note_count = time_backend(filename, backend, args.repeats, args.jobs)
+            except ImportError as e:
+                print(f"{os.path.basename(filename):<30} {backend:<12} skipped ({e})")
+                continue
+            print(f"{os.path.basename(filename):<30} {backend:<12} {note_count:>8} {best_time * 1000:>10.1f} {note_count / best_time:>12.0f}")
+
+if __name__ == "__main__":
+    main()
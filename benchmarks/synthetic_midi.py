@@ -0,0 +1,132 @@
+"""
+Writes synthetic MIDI files for benchmarking, so that the visualiser can be tested on songs
+much larger or denser than example.mid.
+
+    python benchmarks/synthetic_midi.py dense.mid --tracks 16 --notes-per-second 200 --seconds 120
+"""
+import argparse
+import struct
+
+import numpy as np
+
+LENGTH_DISTRIBUTIONS = ["exponential", "uniform", "fixed"]
+
+
+def encode_variable_length(value):
+    """Encodes a number as a MIDI variable length quantity."""
+    encoded = [value & 0x7F]
+    value >>= 7
+    while value:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(encoded))
+
+def encode_track(events):
+    """
+    events is a list of (tick, event bytes) pairs, which are sorted by tick.
+    Returns the whole MTrk chunk, including the end of track event.
+    """
+    data = bytearray()
+    previous_tick = 0
+    for tick, event in sorted(events, key=lambda event: event[0]):
+        data += encode_variable_length(tick - previous_tick)
+        data += event
+        previous_tick = tick
+    data += b"\x00\xFF\x2F\x00"
+    return b"MTrk" + struct.pack(">I", len(data)) + bytes(data)
+
+def write_midi_file(filename, tracks, resolution):
+    """Writes a format 1 MIDI file, where tracks is a list of event lists for encode_track."""
+    with open(filename, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), resolution))
+        for events in tracks:
+            f.write(encode_track(events))
+
+def generate_song(
+        filename,
+        track_count=4,
+        notes_per_second=20,
+        seconds=60,
+        pitch_low=21,
+        pitch_high=108,
+        length_distribution="exponential",
+        mean_length=0.25,
+        tempo_changes=0,
+        resolution=480,
+        seed=0):
+    """
+    Writes a random song and returns the number of notes in it.
+    Notes start at random times and are spread evenly between the tracks.
+    The first track holds the tempo changes, which are spread evenly through the song.
+    Note lengths are measured in beats at 120 BPM, so that they do not depend on the tempo changes.
+    """
+    rng = np.random.default_rng(seed)
+    ticks_per_second = resolution * 2 # At 120 BPM
+    note_count = int(notes_per_second * seconds)
+
+    start_ticks = np.sort(rng.integers(0, int(seconds * ticks_per_second), note_count))
+    if length_distribution == "exponential":
+        lengths = rng.exponential(mean_length, note_count)
+    elif length_distribution == "uniform":
+        lengths = rng.uniform(0, 2 * mean_length, note_count)
+    else:
+        lengths = np.full(note_count, mean_length)
+    end_ticks = start_ticks + np.maximum((lengths * ticks_per_second).astype(np.int64), 1)
+    pitches = rng.integers(pitch_low, pitch_high + 1, note_count)
+    velocities = rng.integers(40, 128, note_count)
+    note_tracks = rng.integers(0, track_count, note_count)
+
+    tempo_events = [(0, b"\xFF\x51\x03" + (500000).to_bytes(3, "big"))]
+    for i in range(1, tempo_changes + 1):
+        tick = int(i * seconds * ticks_per_second / (tempo_changes + 1))
+        microseconds_per_beat = int(60000000 / rng.uniform(60, 200))
+        tempo_events.append((tick, b"\xFF\x51\x03" + microseconds_per_beat.to_bytes(3, "big")))
+    tracks = [tempo_events + [(0, b"\xFF\x58\x04\x04\x02\x18\x08")]]
+
+    for track in range(track_count):
+        channel = track % 16
+        events = []
+        for i in np.flatnonzero(note_tracks == track).tolist():
+            events.append((int(start_ticks[i]), bytes([0x90 | channel, int(pitches[i]), int(velocities[i])])))
+            events.append((int(end_ticks[i]), bytes([0x80 | channel, int(pitches[i]), 0])))
+        tracks.append(events)
+
+    write_midi_file(filename, tracks, resolution)
+    return note_count
+
+def add_song_arguments(parser):
+    """The options of generate_song, shared with the benchmark suite."""
+    parser.add_argument("--tracks", type=int, default=4, help="Number of tracks with notes.")
+    parser.add_argument("--notes-per-second", type=float, default=20)
+    parser.add_argument("--seconds", type=float, default=60, help="Length of the song at 120 BPM.")
+    parser.add_argument("--pitch-low", type=int, default=21)
+    parser.add_argument("--pitch-high", type=int, default=108)
+    parser.add_argument("--length-distribution", choices=LENGTH_DISTRIBUTIONS, default="exponential")
+    parser.add_argument("--mean-length", type=float, default=0.25, help="Mean note length in seconds at 120 BPM.")
+    parser.add_argument("--tempo-changes", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+
+def generate_song_from_args(filename, args):
+    return generate_song(
+        filename,
+        track_count=args.tracks,
+        notes_per_second=args.notes_per_second,
+        seconds=args.seconds,
+        pitch_low=args.pitch_low,
+        pitch_high=args.pitch_high,
+        length_distribution=args.length_distribution,
+        mean_length=args.mean_length,
+        tempo_changes=args.tempo_changes,
+        seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a random MIDI file for benchmarking.")
+    parser.add_argument("output", help="Where to save the MIDI file.")
+    add_song_arguments(parser)
+    args = parser.parse_args()
+
+    note_count = generate_song_from_args(args.output, args)
+    print(f"Wrote {note_count} notes to {args.output}")
+
+if __name__ == "__main__":
+    main()
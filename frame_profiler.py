@@ -0,0 +1,180 @@
+import collections
+import contextlib
+import cProfile
+import csv
+import json
+import time
+
+import numpy as np
+
+# How many of the latest frames the live overlay summarises
+OVERLAY_WINDOW = 120
+
+# Stops the profiler from using more and more memory when it is left on in the live window
+MAX_RECORDED_FRAMES = 100000
+
+NO_STAGE = contextlib.nullcontext()
+
+
+class StageTimer:
+    """Adds the time spent inside a with block to one stage, such as a stage of the current frame."""
+
+    def __init__(self, stages, name):
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.stages[self.name] = self.stages.get(self.name, 0) + time.perf_counter() - self.start
+
+
+class FrameProfiler:
+    """
+    Measures how long each stage of drawing and saving a frame takes, frame by frame.
+    While the profiler is disabled, stage() does nothing, so it can be left around the drawing code.
+
+    A range of frames can also be run under cProfile, which shows the time spent in every function
+    rather than in each stage.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.frames = collections.deque(maxlen=MAX_RECORDED_FRAMES)
+        self.current_frame = None
+        self.frame_count = 0
+        self.finishing = {} # Seconds spent on work done once after the last frame, such as finishing the video
+
+        self.cprofile_range = None # (first frame, last frame), both included
+        self.cprofile_path = None
+        self.cprofile = None
+
+    def enable_cprofile(self, first_frame, last_frame, path):
+        self.enabled = True
+        self.cprofile_range = (first_frame, last_frame)
+        self.cprofile_path = path
+
+    def start_frame(self, song_time=None):
+        if not self.enabled:
+            return
+        self.current_frame = {"frame": self.frame_count, "time": song_time, "stages": {}, "counts": {}, "start": time.perf_counter()}
+
+        if self.cprofile_range is not None and self.frame_count == self.cprofile_range[0]:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def end_frame(self):
+        if self.current_frame is None:
+            return
+        frame = self.current_frame
+        frame["total"] = time.perf_counter() - frame.pop("start")
+        self.current_frame = None
+
+        # Frames which did not draw anything, such as the one which sets up an export, would only skew the results
+        if frame["stages"]:
+            self.frames.append(frame)
+
+        if self.cprofile_range is not None and self.frame_count == self.cprofile_range[1]:
+            self.stop_cprofile()
+        self.frame_count += 1
+
+    def stop_cprofile(self):
+        """Saves the cProfile capture, even if the video ended before the last frame of the range."""
+        if self.cprofile is None:
+            return
+        self.cprofile.disable()
+        self.cprofile.dump_stats(self.cprofile_path)
+        print(f"Saved the profile of frames {self.cprofile_range[0]} to {min(self.frame_count, self.cprofile_range[1])} to {self.cprofile_path}")
+        self.cprofile = None
+
+    def stage(self, name):
+        if self.current_frame is None:
+            return NO_STAGE
+        return StageTimer(self.current_frame["stages"], name)
+
+    def finishing_stage(self, name):
+        """
+        Times work which is done once after the last frame, such as waiting for ffmpeg to finish.
+        The frame it happens in is dropped, so that the work does not show up as one very slow frame.
+        """
+        if not self.enabled:
+            return NO_STAGE
+        self.current_frame = None
+        return StageTimer(self.finishing, name)
+
+    def count(self, name, amount):
+        """Records how many things (e.g. notes or chords) were drawn in the current frame."""
+        if self.current_frame is not None:
+            self.current_frame["counts"][name] = amount
+
+    def clear(self):
+        self.frames.clear()
+        self.finishing.clear()
+
+    def get_stage_names(self, frames):
+        names = []
+        for frame in frames:
+            for name in frame["stages"]:
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def get_summary(self, last_frames=None):
+        """
+        Returns the 50th and 95th percentiles and the maximum of each stage in milliseconds,
+        along with the total time of each frame, over all frames or only the latest ones.
+        """
+        frames = list(self.frames)
+        if last_frames is not None:
+            frames = frames[-last_frames:]
+
+        summary = {}
+        for name in self.get_stage_names(frames) + ["total"]:
+            if name == "total":
+                times = [frame["total"] for frame in frames]
+            else:
+                times = [frame["stages"][name] for frame in frames if name in frame["stages"]]
+            if times:
+                times = np.array(times) * 1000
+                summary[name] = {
+                    "p50": float(np.percentile(times, 50)),
+                    "p95": float(np.percentile(times, 95)),
+                    "max": float(times.max()),
+                }
+        return summary
+
+    def get_frame_rows(self):
+        """One flat row per frame, with times in milliseconds."""
+        frames = list(self.frames)
+        stage_names = self.get_stage_names(frames)
+        count_names = []
+        for frame in frames:
+            count_names += [name for name in frame["counts"] if name not in count_names]
+
+        rows = []
+        for frame in frames:
+            row = {"frame": frame["frame"], "time": frame["time"], "total_ms": frame["total"] * 1000}
+            for name in stage_names:
+                row[f"{name}_ms"] = frame["stages"].get(name, 0) * 1000
+            for name in count_names:
+                row[name] = frame["counts"].get(name, 0)
+            rows.append(row)
+        return rows
+
+    def write_report(self, path):
+        """Writes every recorded frame to a .csv file, or to a .json file along with the summary."""
+        rows = self.get_frame_rows()
+
+        if path.lower().endswith(".json"):
+            with open(path, "w") as f:
+                finishing = {name: seconds * 1000 for name, seconds in self.finishing.items()}
+                json.dump({"summary": self.get_summary(), "finishing_ms": finishing, "frames": rows}, f, indent=2)
+        else:
+            with open(path, "w", newline="") as f:
+                fieldnames = list(rows[0].keys()) if rows else ["frame", "time", "total_ms"]
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(rows)
+
+        print(f"Saved the timings of {len(rows)} frames to {path}")
@@ -0,0 +1,368 @@
+import collections
+import hashlib
+import mmap
+import multiprocessing
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+import note
+
+# Everything the visualiser needs from a MIDI file
+ParsedMidi = collections.namedtuple("ParsedMidi", ["notes", "tempo_changes", "time_signatures", "resolution"])
+
+# Starting processes takes a while, so smaller files are always read in one go
+PARALLEL_PARSE_MIN_BYTES = 8 * 1024 * 1024
+
+# Change this whenever a parser would read a file differently, so that old cached songs are not used
+PARSER_VERSION = 1
+
+DEFAULT_CACHE_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "midi_visualiser")
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def is_note_on(event):
+    """
+    Sometimes Note Offs are marked by
+    event.name = "Note On" and velocity = 0.
+    That's why we have to check both event.name and
+    velocity.
+    """
+    velocity = event.data[1]
+    return event.name == "Note On" and velocity > 0
+
+def read_variable_length(data, position):
+    """Returns a variable length quantity from a MIDI file and the position after it."""
+    byte = data[position]
+    position += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+    return value, position
+
+def decode_track(track_data, track, note_pairer, tempo_changes, time_signatures):
+    """
+    Decodes the events of a single MTrk chunk, keeping only notes, tempos and time signatures.
+    Returns the tick at the end of the track.
+    """
+    # Looking these up once makes a noticeable difference, since this loop runs for every event
+    note_on = note_pairer.note_on
+    note_off = note_pairer.note_off
+
+    position = 0
+    end = len(track_data)
+    tick = 0
+    status = 0 # Used again when an event leaves out its status byte (running status)
+
+    while position < end:
+        # Most delta times fit in a single byte
+        byte = track_data[position]
+        position += 1
+        if byte & 0x80:
+            delta, position = read_variable_length(track_data, position - 1)
+            tick += delta
+        else:
+            tick += byte
+
+        byte = track_data[position]
+
+        # Meta events and system exclusive messages do not change the running status
+        if byte >= 0xF0:
+            position += 1
+            if byte == 0xFF:
+                meta_type = track_data[position]
+                length, position = read_variable_length(track_data, position + 1)
+                if meta_type == 0x51:
+                    microseconds_per_beat = int.from_bytes(track_data[position:position + 3], "big")
+                    tempo_changes.append((tick, 60000000 / microseconds_per_beat))
+                elif meta_type == 0x58:
+                    time_signatures.append((tick, track_data[position], 2 ** track_data[position + 1]))
+                elif meta_type == 0x2F:
+                    break
+            elif byte == 0xF0 or byte == 0xF7:
+                length, position = read_variable_length(track_data, position)
+            else:
+                raise ValueError(f"Unexpected status byte {byte:#x} in track {track}")
+            position += length
+            continue
+
+        if byte & 0x80:
+            status = byte
+            position += 1
+        elif not status:
+            raise ValueError(f"Track {track} has data before its first status byte")
+
+        kind = status & 0xF0
+        if kind == 0x90 or kind == 0x80:
+            pitch = track_data[position]
+            velocity = track_data[position + 1]
+            position += 2
+            if kind == 0x90 and velocity > 0:
+                note_on(track, status & 0x0F, pitch, velocity, tick)
+            else:
+                note_off(status & 0x0F, pitch, tick)
+        elif kind == 0xC0 or kind == 0xD0:
+            position += 1
+        else:
+            position += 2
+
+    return tick
+
+def find_track_chunks(data, filename):
+    """
+    Reads the header of a MIDI file and finds where each MTrk chunk is, without decoding any events.
+    Returns the resolution and a list of (offset, length) pairs.
+    """
+    if data[:4] != b"MThd":
+        raise ValueError(f"{filename} is not a MIDI file")
+    header_length, file_format, track_count, division = struct.unpack(">IHHH", data[4:14])
+    if division & 0x8000:
+        raise ValueError(f"{filename} uses SMPTE timing, which is not supported")
+
+    track_chunks = []
+    position = 8 + header_length
+    while position + 8 <= len(data):
+        chunk_type = data[position:position + 4]
+        chunk_length, = struct.unpack(">I", data[position + 4:position + 8])
+        position += 8
+
+        # Unknown chunks must be skipped, so that later formats can add their own
+        if chunk_type == b"MTrk":
+            track_chunks.append((position, chunk_length))
+        position += chunk_length
+
+    return division, track_chunks
+
+def read_track_chunk(data, filename, track, offset, length):
+    """
+    Decodes one track on its own. Tracks do not depend on each other until their ticks are
+    turned into seconds, which happens once the tempo changes of every track have been collected.
+    Returns the notes, tempo changes and time signatures of the track and its pairing counts.
+    """
+    note_pairer = note.NotePairer()
+    tempo_changes = []
+    time_signatures = []
+    try:
+        end_tick = decode_track(data[offset:offset + length], track, note_pairer, tempo_changes, time_signatures)
+    except IndexError:
+        raise ValueError(f"Track {track} of {filename} ends in the middle of an event")
+    note_pairer.end_track(end_tick)
+
+    return note_pairer.get_notes(), tempo_changes, time_signatures, note_pairer.get_counts()
+
+def read_track_chunk_from_file(filename, track, offset, length):
+    """The same as read_track_chunk, but opens the file itself so that it can run in another process."""
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return read_track_chunk(data, filename, track, offset, length)
+
+def get_parse_jobs(file_size, track_count):
+    """Large files with several tracks are split between processes, one track at a time."""
+    if file_size < PARALLEL_PARSE_MIN_BYTES:
+        return 1
+    return max(min(os.cpu_count() or 1, track_count), 1)
+
+def read_native(filename, jobs=None):
+    """
+    Reads a standard MIDI file straight from its bytes.
+    Only the events which the visualiser uses are decoded, instead of building an object for each one.
+    If jobs is more than 1, the tracks are decoded in that many processes. By default this is only done for large files.
+    """
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        resolution, track_chunks = find_track_chunks(data, filename)
+        if jobs is None:
+            jobs = get_parse_jobs(len(data), len(track_chunks))
+        if multiprocessing.current_process().daemon:
+            jobs = 1 # Daemonic processes, such as the workers of render -j, cannot start processes of their own
+
+        if jobs > 1 and len(track_chunks) > 1:
+            tasks = [(filename, track, offset, length) for track, (offset, length) in enumerate(track_chunks)]
+            with multiprocessing.get_context("spawn").Pool(min(jobs, len(track_chunks))) as pool:
+                tracks = pool.starmap(read_track_chunk_from_file, tasks)
+        else:
+            tracks = [read_track_chunk(data, filename, track, offset, length) for track, (offset, length) in enumerate(track_chunks)]
+
+    note_arrays = [note.NoteArray([], [], [], [], [])]
+    tempo_changes = []
+    time_signatures = []
+    pairing_counts = [0, 0, 0]
+    for track_notes, track_tempo_changes, track_time_signatures, track_pairing_counts in tracks:
+        note_arrays.append(track_notes)
+        tempo_changes += track_tempo_changes
+        time_signatures += track_time_signatures
+        pairing_counts = [total + count for total, count in zip(pairing_counts, track_pairing_counts)]
+
+    print(note.get_pairing_summary(*pairing_counts))
+    return ParsedMidi(note.NoteArray.concatenate(note_arrays), tempo_changes, sorted(time_signatures), resolution)
+
+def read_python_midi(filename):
+    """Reads a MIDI file with the python-midi library, which creates an object for every event."""
+
+    # pip install git+https://github.com/vishnubob/python-midi@feature/python3
+    import midi
+
+    midi_tracks = midi.read_midifile(filename)
+    note_pairer = note.NotePairer()
+    tempo_changes = []
+    time_signatures = []
+
+    for t_index, t in enumerate(midi_tracks):
+        total_ticks = 0
+        for elem in t:
+            total_ticks += elem.tick
+            if elem.name in ["Note On", "Note Off"]:
+                pitch = elem.data[0]
+                if is_note_on(elem):
+                    note_pairer.note_on(t_index, elem.channel, pitch, elem.data[1], total_ticks)
+                else:
+                    note_pairer.note_off(elem.channel, pitch, total_ticks)
+            elif elem.name == "Set Tempo":
+                tempo_changes.append((total_ticks, elem.get_bpm()))
+            elif elem.name == "Time Signature":
+                time_signatures.append((total_ticks, elem.get_numerator(), elem.get_denominator()))
+        note_pairer.end_track(total_ticks)
+
+    print(note_pairer.get_summary())
+    return ParsedMidi(note_pairer.get_notes(), tempo_changes, sorted(time_signatures), midi_tracks.resolution)
+
+def read_pretty_midi(filename):
+    """
+    Reads a MIDI file with pretty_midi, which pairs the notes itself.
+    pretty_midi groups notes by instrument rather than by track, so each instrument is treated as a track.
+    """
+    import pretty_midi
+
+    midi_data = pretty_midi.PrettyMIDI(filename)
+
+    pitches = []
+    velocities = []
+    tracks = []
+    start_times = []
+    end_times = []
+    for i, instrument in enumerate(midi_data.instruments):
+        for midi_note in instrument.notes:
+            pitches.append(midi_note.pitch)
+            velocities.append(midi_note.velocity)
+            tracks.append(i)
+            start_times.append(midi_note.start)
+            end_times.append(midi_note.end)
+
+    start_ticks = [midi_data.time_to_tick(time) for time in start_times]
+    end_ticks = [midi_data.time_to_tick(time) for time in end_times]
+    notes = note.NoteArray(pitches, velocities, tracks, start_ticks, end_ticks)
+
+    tempo_times, tempi = midi_data.get_tempo_changes()
+    tempo_changes = [(int(midi_data.time_to_tick(time)), float(tempo_bpm)) for time, tempo_bpm in zip(tempo_times, tempi)]
+    time_signatures = [(midi_data.time_to_tick(ts.time), ts.numerator, ts.denominator) for ts in midi_data.time_signature_changes]
+
+    return ParsedMidi(notes, tempo_changes, time_signatures, midi_data.resolution)
+
+BACKENDS = {
+    "Native": read_native,
+    "python-midi": read_python_midi,
+    "pretty_midi": read_pretty_midi,
+}
+
+class SongCache:
+    """
+    Keeps the parsed notes of recently opened MIDI files in a folder, so that opening or exporting
+    the same song again does not parse it again. Each song is stored in a compressed .npz file named after
+    a hash of the MIDI file's bytes, the parser version and the backend, so edited files are parsed again.
+    When the folder grows past max_bytes, the songs which were used the longest time ago are deleted.
+    """
+
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def get_path(self, filename, backend):
+        file_hash = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                file_hash.update(block)
+        file_hash.update(f"{PARSER_VERSION} {backend}".encode())
+        return os.path.join(self.folder, f"{file_hash.hexdigest()}.npz")
+
+    def load(self, path):
+        """Returns the song stored at path, or None if it has not been cached."""
+        try:
+            with np.load(path) as data:
+                notes = note.NoteArray(data["pitch"], data["velocity"], data["track"], data["start_ticks"], data["end_ticks"])
+                tempo_changes = [(int(tick), float(tempo_bpm)) for tick, tempo_bpm in data["tempo_changes"]]
+                time_signatures = [tuple(time_signature) for time_signature in data["time_signatures"].tolist()]
+                resolution = int(data["resolution"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            print(f"Ignoring the damaged cache file {path}")
+            os.remove(path)
+            return None
+
+        # Marks the song as recently used, so that it is evicted last
+        os.utime(path)
+        return ParsedMidi(notes, tempo_changes, time_signatures, resolution)
+
+    def save(self, path, parsed):
+        os.makedirs(self.folder, exist_ok=True)
+
+        # Written under another name first, so that a half-written file is never loaded
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                pitch=parsed.notes.pitch,
+                velocity=parsed.notes.velocity,
+                track=parsed.notes.track,
+                start_ticks=parsed.notes.start_ticks,
+                end_ticks=parsed.notes.end_ticks,
+                tempo_changes=np.array(parsed.tempo_changes, dtype=np.float64).reshape(-1, 2),
+                time_signatures=np.array(parsed.time_signatures, dtype=np.int64).reshape(-1, 3),
+                resolution=parsed.resolution)
+        os.replace(temporary_path, path)
+
+        self.evict()
+
+    def evict(self):
+        """Deletes the least recently used songs until the folder fits in max_bytes."""
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith(".npz"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            total_bytes -= size
+
+def read_midi_file(filename, backend="Native", jobs=None, cache=None):
+    """
+    Reads a MIDI file with the chosen backend. The notes are sorted by when they start.
+    jobs is the number of processes used by the Native backend; the other backends always use one.
+    If a SongCache is given, the song is loaded from it when possible and stored in it otherwise.
+    """
+    if cache is not None:
+        cache_path = cache.get_path(filename, backend)
+        parsed = cache.load(cache_path)
+        if parsed is not None:
+            print(f"Loaded {filename} from the song cache")
+            return parsed
+
+    if backend == "Native":
+        parsed = read_native(filename, jobs)
+    else:
+        parsed = BACKENDS[backend](filename)
+    parsed = parsed._replace(notes=parsed.notes.sorted_by_onset())
+
+    if cache is not None:
+        try:
+            cache.save(cache_path, parsed)
+        except OSError as e:
+            print(f"Could not save {filename} to the song cache: {e}")
+    return parsed
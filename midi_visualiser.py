@@ -1,97 +1,176 @@
-import cv2
-import ffmpeg
-from idlelib.tooltip import Hovertip
+import argparse
+import collections
 import math
 import os
-import pretty_midi
 import pygame as pg
-import tkinter as tk
-import tkinter.filedialog
-import tkinter.messagebox
-import tkinter.ttk as ttk
 import configparser
+import functools
+import multiprocessing
+import numpy as np
+import queue
 import random
 import re
 import shutil
 import subprocess
+import sys
+import tempfile
+import threading
+import time
 
-
-# pip install git+https://github.com/vishnubob/python-midi@feature/python3
-import midi
+import frame_profiler
+import midi_parser
 import note
 
 DEFAULT_SCREEN_WIDTH = 1250
 DEFAULT_SCREEN_HEIGHT = 600
 
-pg.init()
-screen = pg.display.set_mode((DEFAULT_SCREEN_WIDTH, DEFAULT_SCREEN_HEIGHT), pg.RESIZABLE)
-pg.display.set_caption("LuckyLootCrate's MIDI Visualiser")
-FONT = pg.font.SysFont('Times New Roman', 20)
+# Where F4 saves the frame timings
+PROFILE_REPORT_PATH = "frame_profile.csv"
+
+# Notes closer together than this look joined up, so when zoomed out they are drawn as one note
+MAX_MERGED_GAP_PIXELS = 0.5
+
+# How far the playback clock may wander from the audio before it jumps back to it
+AUDIO_RESYNC_THRESHOLD = 0.05
 
-def is_note_on(event):
+screen = None
+
+# Imported by load_tkinter the first time a dialog or the settings are opened
+tk = None
+ttk = None
+Hovertip = None
+
+def load_tkinter():
+    """
+    tkinter (and idlelib, for the colour tooltips) take a while to import and are only needed once a window
+    other than the visualisation is opened, so rendering from the command line never imports them.
     """
-    Sometimes Note Offs are marked by
-    event.name = "Note On" and velocity = 0.
-    That's why we have to check both event.name and
-    velocity.
+    global tk, ttk, Hovertip
+    import tkinter
+    import tkinter.filedialog
+    import tkinter.messagebox
+    import tkinter.simpledialog
+    import tkinter.ttk
+    from idlelib.tooltip import Hovertip
+    tk = tkinter
+    ttk = tkinter.ttk
+
+def init_display(width=DEFAULT_SCREEN_WIDTH, height=DEFAULT_SCREEN_HEIGHT, headless=False):
     """
-    velocity = event.data[1]
-    return event.name == "Note On" and velocity > 0
+    Creates the surface everything is drawn onto.
+    Headless displays use SDL's dummy drivers, so no window or audio device is needed.
+    """
+    global screen
+
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+        pg.init()
+        screen = pg.display.set_mode((width, height))
+    else:
+        pg.init()
+        screen = pg.display.set_mode((width, height), pg.RESIZABLE)
+        pg.display.set_caption("LuckyLootCrate's MIDI Visualiser")
 
-def calculate_note_times(note_tracks, tempo_bpm, resolution):
+def calculate_note_times(notes, tempo_map):
     """
-    Calculate start_time and end_time for all notes.
-    This only works if the MIDI file does not contain
-    any tempo changes.
+    Calculate start_time and end_time for all notes,
+    following every tempo change in the tempo map.
     """
-    for t in note_tracks:
-        for pl in t:
-            for n in pl:
-                n.calculate_start_and_end_time(tempo_bpm, resolution)
+    notes.calculate_start_and_end_time(tempo_map)
 
-def get_pitch_min_max(note_tracks):
+def get_pitch_min_max(notes):
     """
     In order not to waste space,
     we may want to know in advance what the highest and lowest
     pitches of the MIDI notes are.
     """
-    pitch_min = 128
-    pitch_max = 0
-    for t in note_tracks:
-        for pitch_list in t:
-            for note in pitch_list:
-                pitch = note.pitch
-                if pitch > pitch_max:
-                    pitch_max = pitch
-                if pitch < pitch_min:
-                    pitch_min = pitch
-    return pitch_min, pitch_max
-
-def get_maximum_time(note_tracks):
+    if len(notes) == 0:
+        return 128, 0
+    return int(notes.pitch.min()), int(notes.pitch.max())
+
+def get_maximum_time(notes):
     """
     Determines the largest value of end_time
     among all notes. This is required to know
     when the video should end.
     """
-    maximum_time = -999999.9
-    for t in note_tracks:
-        for pitch_list in t:
-            if pitch_list != []:
-                if pitch_list[-1].end_time > maximum_time:
-                    maximum_time = pitch_list[-1].end_time
-    return maximum_time
+    if len(notes) == 0:
+        return -999999.9
+    return float(notes.end_time.max())
 
 
-def is_note_active(note, time):
+def is_note_active(start_time, end_time, time):
     """
     Notes that are currently playing may be treated differently.
     """
 
-    if note.start_time <= time and note.end_time >= time and time != 0:
+    if start_time <= time and end_time >= time and time != 0:
         return True
     else:
         return False
 
+def get_next_time(times, time):
+    """Returns the first of the sorted times which is after time, or None if there are none."""
+    i = np.searchsorted(times, time, side="right")
+    return float(times[i]) if i < len(times) else None
+
+def get_previous_time(times, time):
+    """Returns the last of the sorted times which is before time, or None if there are none."""
+    i = np.searchsorted(times, time, side="left")
+    return float(times[i - 1]) if i > 0 else None
+
+def parse_timestamp(timestamp):
+    """Converts a time such as "1:23.5", "01:02:03" or "83" into seconds."""
+    match = re.match(r"^\s*(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d*)?)\s*$", timestamp)
+    if not match:
+        raise ValueError(f"{timestamp!r} is not a time such as 1:23")
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)
+
+def sort_into_drawing_order(notes, indices):
+    """Notes are drawn track by track and pitch by pitch, so that later tracks are always drawn on top."""
+    return indices[np.lexsort((notes.start_ticks[indices], notes.pitch[indices], notes.track[indices]))]
+
+class Song:
+    """
+    A MIDI file which has been read into memory, with the start and end time of every note.
+    None of this depends on the settings, so the song is only read again when another file is opened.
+    """
+
+    def __init__(self, filename, notes, tempo_map, time_signatures):
+        self.filename = filename
+        self.notes = notes
+        self.tempo_map = tempo_map
+        self.resolution = tempo_map.resolution
+        self.time_signatures = time_signatures
+
+        calculate_note_times(notes, tempo_map)
+        self.pitch_min, self.pitch_max = get_pitch_min_max(notes)
+        self.end_time = get_maximum_time(notes)
+        self.tracks = np.unique(notes.track).tolist()
+
+        # Sorted times to skip between, searched with get_next_time and get_previous_time
+        self.onsets = np.unique(notes.start_time)
+        end_tick = int(notes.end_ticks.max()) if len(notes) else 0
+        beat_ticks, bar_ticks = note.get_beat_and_bar_ticks(time_signatures, self.resolution, end_tick)
+        self.beat_times = tempo_map.ticks_to_seconds(beat_ticks)
+        self.bar_times = tempo_map.ticks_to_seconds(bar_ticks)
+
+        self.note_levels = note.NoteLevels(notes)
+
+    def get_notes_at_zoom(self, pixels_per_second):
+        """The notes, with the ones too close together to see the gap between them joined up."""
+        level = note.NoteLevels.choose_level(pixels_per_second, MAX_MERGED_GAP_PIXELS)
+        if level is None:
+            return self.notes
+        return self.note_levels.get_level(level)
+
+    def get_active_notes(self, time):
+        """The notes which start at or before the time and end at or after it, in drawing order."""
+        indices = self.notes.get_indices_between(time, np.nextafter(time, np.inf))
+        return self.notes.take(sort_into_drawing_order(self.notes, indices))
+
 def is_chord_active(chord, time):
     if chord.start_time <= time and chord.end_time > time and time != 0:
         return True
@@ -116,6 +195,191 @@ def delete_and_create_folders():
             shutil.rmtree(f)
         os.mkdir(f)
 
+def get_ffmpeg_output_args(video_path):
+    """
+    The encoding settings which are shared by every way of exporting a video.
+    """
+    return [
+        "-vcodec", "libx264",
+        "-crf", "25",
+        "-pix_fmt", "yuv420p",
+        "-vf", "crop=trunc(iw/2)*2:trunc(ih/2)*2",
+        "-y", # Always overwrite
+        video_path
+    ]
+
+class VideoPipe:
+    """
+    Keeps a single ffmpeg process open and writes raw frames into its stdin,
+    so that encoding happens alongside rendering without any temporary images.
+    """
+
+    def __init__(self, video_path, size, frame_rate):
+        self.size = size
+
+        call_list = []
+        call_list.append("ffmpeg")
+        call_list.append("-f")
+        call_list.append("rawvideo")
+        call_list.append("-pix_fmt")
+        call_list.append("rgb24")
+        call_list.append("-s")
+        call_list.append(f"{size[0]}x{size[1]}")
+        call_list.append("-r")
+        call_list.append(f"{frame_rate}")
+        call_list.append("-i")
+        call_list.append("-") # Read the frames from stdin
+        call_list.extend(get_ffmpeg_output_args(video_path))
+
+        print(call_list)
+        self.process = subprocess.Popen(call_list, stdin=subprocess.PIPE)
+
+    def write(self, surface):
+        # The frame size cannot change once ffmpeg has started, so resized windows are scaled back
+        if surface.get_size() != self.size:
+            surface = pg.transform.scale(surface, self.size)
+        self.process.stdin.write(pg.image.tostring(surface, "RGB"))
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class FrameWriter:
+    """
+    Saves frames as images on background threads, so that rendering, JPEG encoding and disk writes overlap.
+    cv2 releases the GIL while it encodes and writes, so several threads really do run at once.
+    The queue is bounded: when the writers fall behind, write() waits, which caps the memory used by queued frames.
+    """
+
+    def __init__(self, thread_count, queue_depth, jpeg_quality=95):
+        import cv2 # Only needed when exporting images
+
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.jpeg_quality = jpeg_quality
+        self.error = None
+        self.threads = [threading.Thread(target=self.write_frames, daemon=True) for i in range(thread_count)]
+        for thread in self.threads:
+            thread.start()
+
+    def write(self, surface, path):
+        if self.error is not None:
+            raise self.error
+        # Copying the pixels is the only work done on the rendering thread
+        self.queue.put((pg.image.tostring(surface, "RGB"), surface.get_size(), path))
+
+    def write_frames(self):
+        import cv2
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            pixels, (width, height), path = item
+            try:
+                image = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 3)
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+                if not cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]):
+                    raise OSError(f"Could not save the frame {path}")
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        """Waits for every queued frame to be saved."""
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class PlaybackClock:
+    """
+    Works out where the song should be on each live frame from a high resolution timer, which is kept in step
+    with the audio in playback mode. A slow frame makes the song jump ahead (dropping the frames in between)
+    rather than slowing down, so the visuals never fall behind the sound.
+
+    It also counts the frames which were late, and how far the clock had moved on from a frame by the time
+    it was shown, which tells you whether a song is too dense to be drawn in real time.
+    """
+
+    def __init__(self):
+        self.anchor_time = None # Song time when the clock was last started, or None while stopped
+        self.anchor_counter = None
+        self.last_time = None
+        self.last_counter = None
+        self.follow_audio = False
+        self.audio_start_time = None
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.frames = 0
+        self.late_frames = 0
+        self.dropped_frames = 0
+        self.frames_dropped_last_tick = 0
+        self.audio_resyncs = 0
+        self.drift = 0
+        self.max_drift = 0
+
+    @property
+    def is_running(self):
+        return self.anchor_time is not None
+
+    def start(self, song_time, follow_audio=False):
+        """With follow_audio, song_time is where the song was when pg.mixer.music started playing."""
+        self.anchor_time = song_time
+        self.anchor_counter = time.perf_counter()
+        self.last_time = song_time
+        self.last_counter = self.anchor_counter
+        self.follow_audio = follow_audio
+        self.audio_start_time = song_time
+
+    def stop(self):
+        self.anchor_time = None
+
+    def get_clock_time(self):
+        """Where the song is right now."""
+        counter = time.perf_counter()
+        clock_time = self.anchor_time + counter - self.anchor_counter
+
+        # The audio position only moves on once per mixer buffer, so it is only used to correct the timer
+        if self.follow_audio:
+            position = pg.mixer.music.get_pos()
+            if position >= 0:
+                audio_time = self.audio_start_time + position / 1000
+                if abs(audio_time - clock_time) > AUDIO_RESYNC_THRESHOLD:
+                    self.anchor_time = audio_time
+                    self.anchor_counter = counter
+                    self.audio_resyncs += 1
+                    clock_time = audio_time
+        return clock_time
+
+    def tick(self, song_time, frame_rate):
+        """
+        Returns the time of the next frame, given the time of the frame before it.
+        If the song was moved somewhere else in between (e.g. by skipping to a note), the clock starts again from there.
+        """
+        if not self.is_running or (song_time != self.last_time and not self.follow_audio):
+            self.start(song_time)
+
+        counter = time.perf_counter()
+        frames_passed = round((counter - self.last_counter) * frame_rate)
+        self.frames += 1
+        self.frames_dropped_last_tick = max(frames_passed - 1, 0)
+        if self.frames_dropped_last_tick:
+            self.late_frames += 1
+            self.dropped_frames += self.frames_dropped_last_tick
+
+        self.last_counter = counter
+        self.last_time = self.get_clock_time()
+        return self.last_time
+
+    def frame_shown(self, song_time):
+        """Records how far behind the clock a frame was when it reached the screen."""
+        self.drift = self.get_clock_time() - song_time
+        self.max_drift = max(self.max_drift, self.drift)
+
 
 def convert_hex_to_rgb(hexcode):
     if hexcode.startswith('#'):
@@ -125,8 +389,8 @@ def convert_hex_to_rgb(hexcode):
 def convert_rgb_to_hex(r, g, b):
     return '#' + ''.join((hex(int(i))[2:]).zfill(2) for i in (r,g,b))
 
-def calculate_lighter_shade(hexcode, proportion=0.5):
-    r, g, b = convert_hex_to_rgb(hexcode)
+def calculate_lighter_rgb(rgb, proportion=0.5):
+    r, g, b = rgb
 
     # Lightens the colours by a fixed proportion
     if proportion >= 0:
@@ -138,7 +402,21 @@ def calculate_lighter_shade(hexcode, proportion=0.5):
     else:
         r, g, b = [round(i*(1 - abs(proportion))) for i in (r,g,b)]
 
-    return convert_rgb_to_hex(r,g, b)
+    return r, g, b
+
+def calculate_lighter_shade(hexcode, proportion=0.5):
+    return convert_rgb_to_hex(*calculate_lighter_rgb(convert_hex_to_rgb(hexcode), proportion))
+
+def compile_track_palette(track_colors, activation_brightness):
+    """
+    Converts the hex colour of each track into RGB once, along with the colour it turns when activated,
+    so that drawing a note only needs a dictionary lookup.
+    """
+    track_palette = {}
+    for track, hexcode in track_colors.items():
+        rgb = tuple(convert_hex_to_rgb(hexcode))
+        track_palette[track] = (rgb, calculate_lighter_rgb(rgb, activation_brightness))
+    return track_palette
 
 def is_chord_valid(chord):
     return bool(re.match(r'^.+\[[a-i]\.?\]$', chord))
@@ -198,11 +476,49 @@ class Chord:
         self.start_time = start_time
         self.end_time = end_time
         self.app = app
-        self.font = pg.font.SysFont('Times New Roman', 15)
-        self.width, self.height = self.font.size(text)
 
     def __repr__(self):
         return f"Chord({self.text}, {self.start_time}, {self.end_time})"
+
+@functools.lru_cache(maxsize=32)
+def get_font(name, size):
+    """Looking up a system font is slow, so each font is only created once per size."""
+    return pg.font.SysFont(name, size)
+
+@functools.lru_cache(maxsize=512)
+def render_chord_text(text, size, color):
+    """
+    The same few chords are drawn on almost every frame, so the rendered text is reused.
+    The colour already tells apart active and inactive chords.
+    """
+    return get_font("Verdana", size).render(text, False, color)
+
+def create_filled_surface(size, color, flags=0):
+    surface = pg.Surface(size, flags)
+    surface.fill(color)
+    return surface
+
+class LayerCache:
+    """
+    Holds the layers of each frame which stay the same until the screen or settings change,
+    such as the background gradient, the margins and the marker lines.
+    Each layer is keyed by everything it is drawn from, so a layer is only created once.
+    """
+
+    def __init__(self):
+        self.layers = {}
+
+    def get(self, key, create_layer):
+        if key not in self.layers:
+            self.layers[key] = create_layer()
+        return self.layers[key]
+
+    def clear(self):
+        self.layers = {}
+
+def clear_chord_text_cache():
+    """Called when the screen is resized or the theme changes, since none of the old surfaces will be drawn again."""
+    render_chord_text.cache_clear()
         
 class Visualisation:
     def __init__(self, name, app):
@@ -221,10 +537,16 @@ class Visualisation:
         # Font size in respect to changes in screen width
         #return min(height_proportion, width_proportion)
 
+    def snap_to_pixels(self, times):
+        """Converts times into whole numbers of pixels from time 0, always rounding halves up so that shifting the grid never moves a note."""
+        return np.floor(np.asarray(times) * self.pixels_per_second + 0.5).astype(np.int64)
+
 class SynthesiaVisualisation(Visualisation):
     """A synthesia style visualisation which involves notes falling from the top of the screen. The current time marker is near the bottom."""
 
     name = "Synthesia"
+    is_vertical = True
+    is_scrolling = True
     
     def __init__(self, app):
         self.app = app
@@ -252,7 +574,7 @@ class SynthesiaVisualisation(Visualisation):
 
     def draw_chords(self, current_chords, time, bottom_edge_timestamp, top_edge_timestamp):
 
-        font = pg.font.SysFont("Verdana", round(self.font_size_proportion * self.app.screen_height))
+        font_size = round(self.font_size_proportion * self.app.screen_height)
         margin_width = self.app.edge_margin_proportion * self.app.screen_width
 
         # Since surfaces don't have positions, you need to track where the topleft should be depending on the margin surface
@@ -260,15 +582,19 @@ class SynthesiaVisualisation(Visualisation):
             'Top': (self.right_margin, (self.app.screen_width-margin_width, 0)),
             'Bottom': (self.left_margin, (0, 0))
         }[self.app.chord_side]
+        margin_rect = margin.get_rect(topleft=topleft)
 
         # If there is a gradient, choose the first color
-        if len(app.theme.bg_color) == 2:
-            bg_color = app.theme.bg_color[0]
+        if len(self.app.theme.bg_color) == 2:
+            bg_color = self.app.theme.bg_color[0]
         else:
-            bg_color = app.theme.bg_color
+            bg_color = self.app.theme.bg_color
+
+        dynamic_chord_color = calculate_lighter_shade(bg_color, proportion=0.2)
+        active_dynamic_chord_color = calculate_lighter_shade(dynamic_chord_color, self.app.activation_brightness)
+        active_static_chord_color = calculate_lighter_shade(bg_color, self.app.activation_brightness)
         
         for chord in current_chords:
-            chord_height = font.size(chord.text)[1]
             
             if self.app.chord_style in ['Dynamic', 'Dynamic Inline']:
                 duration = chord.end_time - chord.start_time
@@ -278,25 +604,22 @@ class SynthesiaVisualisation(Visualisation):
                 else:
                     chord_offset = duration * self.pixels_per_second
 
+                if is_chord_active(chord, time):
+                    chord_color = active_dynamic_chord_color
+                else:
+                    chord_color = dynamic_chord_color
+                rendered_chord = render_chord_text(chord.text, font_size, chord_color)
+
                 # Center the chord
-                chord_offset -= (chord_height // 2)
+                chord_offset -= (rendered_chord.get_height() // 2)
                 y_pos = round(-(chord.end_time - top_edge_timestamp) * self.pixels_per_second) + chord_offset
-                
-                chord_color = calculate_lighter_shade(bg_color, proportion=0.2)
-                if is_chord_active(chord, time):
-                    chord_color = calculate_lighter_shade(chord_color, self.app.activation_brightness)
-                rendered_chord = font.render(chord.text, False, chord_color)
-                screen.blit(rendered_chord, rendered_chord.get_rect(y=y_pos, centerx=margin.get_rect(topleft=topleft).centerx))
+                screen.blit(rendered_chord, rendered_chord.get_rect(y=y_pos, centerx=margin_rect.centerx))
                 
             elif self.app.chord_style == 'Static':
 
                 if is_chord_active(chord, time):
-                    chord_color = calculate_lighter_shade(bg_color, self.app.activation_brightness)
-                    rendered_chord = font.render(chord.text, False, chord_color)
-                    screen.blit(rendered_chord, rendered_chord.get_rect(
-                        centery=margin.get_rect(topleft=topleft).centery,
-                        centerx=margin.get_rect(topleft=topleft).centerx)
-                    )
+                    rendered_chord = render_chord_text(chord.text, font_size, active_static_chord_color)
+                    screen.blit(rendered_chord, rendered_chord.get_rect(centery=margin_rect.centery, centerx=margin_rect.centerx))
 
     def draw_notes(self, current_notes, time, bottom_edge_timestamp, top_edge_timestamp, pitch_min, pitch_max, width, roundedness):
         """
@@ -308,6 +631,27 @@ class SynthesiaVisualisation(Visualisation):
         However, the spare margin width is used so that the notes can be spaced half a margin gap between the border.
         """
 
+        xs, ys, widths, heights = self.get_note_rects(current_notes, pitch_min, pitch_max, top_edge_timestamp)
+
+        for x_pos, y_pos, note_width, y_height, start_time, end_time, track in zip(
+                xs.tolist(),
+                ys.tolist(),
+                widths.tolist(),
+                heights.tolist(),
+                current_notes.start_time.tolist(),
+                current_notes.end_time.tolist(),
+                current_notes.track.tolist()):
+
+            # Note colors
+            note_color, activated_color = self.app.track_palette[track]
+            if is_note_active(start_time, end_time, time):
+                note_color = activated_color
+
+            pg.draw.rect(screen, note_color, [x_pos, y_pos, note_width, y_height], width=width, border_radius=roundedness)
+
+    def get_note_columns(self, pitches, pitch_min, pitch_max):
+        """Returns the x position of each note's column and the width which every note has."""
+
         if self.app.should_draw_margin:
             margin_multiplier = 1.5
         else:
@@ -318,24 +662,31 @@ class SynthesiaVisualisation(Visualisation):
         column_width = (self.app.screen_width - (2.0 * self.margin_x * margin_multiplier)) / no_of_columns
         note_width = round(max(1, column_width - self.pixels_to_remove_from_notes_x))
 
-        for note in current_notes:
-            col_no = note.pitch - pitch_min
-            x_pos = round((self.margin_x*margin_multiplier) + (col_no * column_width))
-            y_pos = round(-(note.end_time - top_edge_timestamp) * self.pixels_per_second)
-            y_height = max(1, round((note.end_time - note.start_time) * self.pixels_per_second - self.pixels_to_remove_from_notes_y))
+        col_nos = pitches.astype(np.int64) - pitch_min
+        return np.rint((self.margin_x*margin_multiplier) + (col_nos * column_width)).astype(np.int64), note_width
 
-            # Note colors
-            note_color = self.app.track_colors[note.track]
-            if is_note_active(note, time):
-                note_color = calculate_lighter_shade(note_color, self.app.activation_brightness)
+    def get_note_heights(self, notes):
+        return np.maximum(1, np.rint((notes.end_time - notes.start_time) * self.pixels_per_second - self.pixels_to_remove_from_notes_y)).astype(np.int64)
 
-            pg.draw.rect(screen, note_color, [x_pos, y_pos, note_width, y_height], width=width, border_radius=roundedness)
+    def get_note_rects(self, notes, pitch_min, pitch_max, top_edge_timestamp):
+        """Returns the x positions, y positions, widths and heights of the notes as arrays."""
+
+        xs, note_width = self.get_note_columns(notes.pitch, pitch_min, pitch_max)
+        ys = np.rint(-(notes.end_time - top_edge_timestamp) * self.pixels_per_second).astype(np.int64)
+        return xs, ys, np.full(len(notes), note_width), self.get_note_heights(notes)
+
+    def get_snapped_note_rects(self, notes, pitch_min, pitch_max, top_edge_pixel):
+        """The same as get_note_rects, except that the notes are snapped to the pixel grid and top_edge_pixel is measured on that grid."""
+
+        xs, note_width = self.get_note_columns(notes.pitch, pitch_min, pitch_max)
+        ys = top_edge_pixel - self.snap_to_pixels(notes.end_time)
+        return xs, ys, np.full(len(notes), note_width), self.get_note_heights(notes)
 
     def draw_time_marker(self):
         """This will draw the time marker (where notes will appear to get activated)"""
 
-        time_marker = pg.Surface((self.app.screen_width, 1), pg.SRCALPHA)
-        time_marker.fill((255, 255, 255, 100))
+        size = (self.app.screen_width, 1)
+        time_marker = self.app.layer_cache.get(("time marker", size), lambda: create_filled_surface(size, (255, 255, 255, 100), pg.SRCALPHA))
         screen.blit(time_marker, (0, self.app.screen_height * (1 - self.activation_proportion)))
 
     def draw_margin(self, not_hidden=True):
@@ -343,10 +694,12 @@ class SynthesiaVisualisation(Visualisation):
         
         margin_width = self.app.edge_margin_proportion * self.app.screen_width
         
-        self.right_margin = pg.Surface((margin_width, self.app.screen_height))
-        self.right_margin.fill(self.app.theme.margin_color)
-        self.left_margin = pg.Surface((margin_width, self.app.screen_height))
-        self.left_margin.fill(self.app.theme.margin_color)
+        size = (margin_width, self.app.screen_height)
+        margin_color = self.app.theme.margin_color
+
+        # Both margins are the same, but they are kept as separate surfaces in case one of them changes
+        self.right_margin = self.app.layer_cache.get(("right margin", size, margin_color), lambda: create_filled_surface(size, margin_color))
+        self.left_margin = self.app.layer_cache.get(("left margin", size, margin_color), lambda: create_filled_surface(size, margin_color))
 
         if not_hidden:
             screen.blit(self.right_margin, (self.app.screen_width-margin_width, 0))
@@ -368,14 +721,16 @@ class SynthesiaVisualisation(Visualisation):
     def draw_chord_line(self, y_pos):
         """Each line will show where each chord begins."""
         
-        chord_line = pg.Surface((self.app.screen_width, 1), pg.SRCALPHA)
-        chord_line.fill((255, 255, 255, 50))
+        size = (self.app.screen_width, 1)
+        chord_line = self.app.layer_cache.get(("chord line", size), lambda: create_filled_surface(size, (255, 255, 255, 50), pg.SRCALPHA))
         screen.blit(chord_line, (0, y_pos))
          
 class ClassicVisualisation(Visualisation):
     """The default visualisation which involves scrolling notes from right to left. The time_marker is in the center."""
 
     name = "Classic"
+    is_vertical = False
+    is_scrolling = True
     
     def __init__(self, app):        
         self.app = app
@@ -403,7 +758,7 @@ class ClassicVisualisation(Visualisation):
         
     def draw_chords(self, current_chords, time, left_edge_timestamp, right_edge_timestamp):
 
-        font = pg.font.SysFont("Verdana", round(self.font_size_proportion * self.app.screen_height))
+        font_size = round(self.font_size_proportion * self.app.screen_height)
         margin_height = self.app.edge_margin_proportion * self.app.screen_height
 
         # Since surfaces don't have positions, you need to track where the topleft should be depending on the margin surface
@@ -411,15 +766,19 @@ class ClassicVisualisation(Visualisation):
             'Top': (self.top_margin, (0, 0)),
             'Bottom': (self.bottom_margin, (0, self.app.screen_height-margin_height))
         }[self.app.chord_side]
+        margin_rect = margin.get_rect(topleft=topleft)
 
         # If there is a gradient, choose the first color
-        if len(app.theme.bg_color) == 2:
-            bg_color = app.theme.bg_color[0]
+        if len(self.app.theme.bg_color) == 2:
+            bg_color = self.app.theme.bg_color[0]
         else:
-            bg_color = app.theme.bg_color
+            bg_color = self.app.theme.bg_color
+
+        dynamic_chord_color = calculate_lighter_shade(bg_color, proportion=0.2)
+        active_dynamic_chord_color = calculate_lighter_shade(dynamic_chord_color, self.app.activation_brightness)
+        active_static_chord_color = calculate_lighter_shade(bg_color, self.app.activation_brightness)
         
         for chord in current_chords:
-            chord_width = font.size(chord.text)[0]
             
             if self.app.chord_style in ['Dynamic', 'Dynamic Inline']:
                 duration = chord.end_time - chord.start_time
@@ -429,26 +788,26 @@ class ClassicVisualisation(Visualisation):
                 else:
                     chord_offset = 0
 
+                if is_chord_active(chord, time):
+                    chord_color = active_dynamic_chord_color
+                else:
+                    chord_color = dynamic_chord_color
+                rendered_chord = render_chord_text(chord.text, font_size, chord_color)
+
                 # Center the chord
-                chord_offset -= (chord_width // 2)
+                chord_offset -= (rendered_chord.get_width() // 2)
                 x_pos = round((chord.start_time - left_edge_timestamp) * self.pixels_per_second) + chord_offset
-
-                chord_color = calculate_lighter_shade(bg_color, proportion=0.2)
-                if is_chord_active(chord, time):
-                    chord_color = calculate_lighter_shade(chord_color, self.app.activation_brightness)
-                rendered_chord = font.render(chord.text, False, chord_color)
-                screen.blit(rendered_chord, rendered_chord.get_rect(x=x_pos, centery=margin.get_rect(topleft=topleft).centery))
+                screen.blit(rendered_chord, rendered_chord.get_rect(x=x_pos, centery=margin_rect.centery))
 
             elif self.app.chord_style == 'Static':
-                first_quadrant = self.app.screen_width // 4
-
-                # Centred within the 4th quadrant
-                x_pos = (first_quadrant // 2) - (chord_width // 2)
 
                 if is_chord_active(chord, time):
-                    chord_color = calculate_lighter_shade(bg_color, self.app.activation_brightness)
-                    rendered_chord = font.render(chord.text, False, chord_color)
-                    screen.blit(rendered_chord, rendered_chord.get_rect(x=x_pos, centery=margin.get_rect(topleft=topleft).centery))
+                    rendered_chord = render_chord_text(chord.text, font_size, active_static_chord_color)
+                    first_quadrant = self.app.screen_width // 4
+
+                    # Centred within the 4th quadrant
+                    x_pos = (first_quadrant // 2) - (rendered_chord.get_width() // 2)
+                    screen.blit(rendered_chord, rendered_chord.get_rect(x=x_pos, centery=margin_rect.centery))
         
         
     def draw_notes(self, current_notes, time, left_edge_timestamp, right_edge_timestamp, pitch_min, pitch_max, width, roundedness):
@@ -461,6 +820,34 @@ class ClassicVisualisation(Visualisation):
         However, the spare margin height is used so that the notes can be spaced half a margin gap between the border.
         """
 
+        xs, ys, lengths, heights = self.get_note_rects(current_notes, pitch_min, pitch_max, left_edge_timestamp)
+
+        # Notes are drawn from low pitch to high pitch
+        for x_pos, y_pos, x_length, note_height, start_time, end_time, track in zip(
+                xs.tolist(),
+                ys.tolist(),
+                lengths.tolist(),
+                heights.tolist(),
+                current_notes.start_time.tolist(),
+                current_notes.end_time.tolist(),
+                current_notes.track.tolist()):
+
+            # Note colors
+            note_color, activated_color = self.app.track_palette[track]
+            if is_note_active(start_time, end_time, time):
+                note_color = activated_color
+
+            """Opacity is too slow lol (and also gives uninteresting results)"""
+            #note_rect = pg.Surface((x_length, note_height))
+            #note_rect.set_alpha(self.app.alpha)
+            #note_rect.fill(note_color)
+            #screen.blit(note_rect, (x_pos, y_pos))
+            
+            pg.draw.rect(screen, note_color, [x_pos, y_pos, x_length, note_height], width=width, border_radius=roundedness)
+
+    def get_note_rows(self, pitches, pitch_min, pitch_max):
+        """Returns the y position of each note's row and the height which every note has."""
+
         if self.app.should_draw_margin:
             margin_multiplier = 1.5
         else:
@@ -471,34 +858,32 @@ class ClassicVisualisation(Visualisation):
         row_height = (self.app.screen_height - (2 * self.margin_y * margin_multiplier)) / no_of_rows
         note_height = round(max(1, row_height - self.pixels_to_remove_from_notes_y))
 
-        # Notes are drawn from low pitch to high pitch
-        for note in current_notes:
-            row_no = note.pitch - pitch_min
+        # You subtract note_height since the margin was previously calculated from the bottom of the screen to the top of the note
+        row_nos = pitches.astype(np.int64) - pitch_min
+        return np.rint((self.app.screen_height - (self.margin_y*margin_multiplier) - note_height) - (row_nos * row_height)).astype(np.int64), note_height
 
-            # You subtract note_height since the margin was previously calculated from the bottom of the screen to the top of the note
-            y_pos = round((self.app.screen_height - (self.margin_y*margin_multiplier) - note_height) - (row_no * row_height))
-                
-            x_pos = round((note.start_time - left_edge_timestamp) * self.pixels_per_second)
-            x_length = max(1, round((note.end_time - note.start_time) * self.pixels_per_second - self.pixels_to_remove_from_notes_x))
+    def get_note_lengths(self, notes):
+        return np.maximum(1, np.rint((notes.end_time - notes.start_time) * self.pixels_per_second - self.pixels_to_remove_from_notes_x)).astype(np.int64)
 
-            # Note colors
-            note_color = self.app.track_colors[note.track]
-            if is_note_active(note, time):
-                note_color = calculate_lighter_shade(note_color, self.app.activation_brightness)
+    def get_note_rects(self, notes, pitch_min, pitch_max, left_edge_timestamp):
+        """Returns the x positions, y positions, lengths and heights of the notes as arrays."""
 
-            """Opacity is too slow lol (and also gives uninteresting results)"""
-            #note_rect = pg.Surface((x_length, note_height))
-            #note_rect.set_alpha(self.app.alpha)
-            #note_rect.fill(note_color)
-            #screen.blit(note_rect, (x_pos, y_pos))
-            
-            pg.draw.rect(screen, note_color, [x_pos, y_pos, x_length, note_height], width=width, border_radius=roundedness)
+        ys, note_height = self.get_note_rows(notes.pitch, pitch_min, pitch_max)
+        xs = np.rint((notes.start_time - left_edge_timestamp) * self.pixels_per_second).astype(np.int64)
+        return xs, ys, self.get_note_lengths(notes), np.full(len(notes), note_height)
+
+    def get_snapped_note_rects(self, notes, pitch_min, pitch_max, left_edge_pixel):
+        """The same as get_note_rects, except that the notes are snapped to the pixel grid and left_edge_pixel is measured on that grid."""
+
+        ys, note_height = self.get_note_rows(notes.pitch, pitch_min, pitch_max)
+        xs = self.snap_to_pixels(notes.start_time) - left_edge_pixel
+        return xs, ys, self.get_note_lengths(notes), np.full(len(notes), note_height)
         
     def draw_time_marker(self):
         """This will draw the time marker (where notes will appear to get activated)"""
         
-        time_marker = pg.Surface((1, self.app.screen_height), pg.SRCALPHA)
-        time_marker.fill((255, 255, 255, 100))
+        size = (1, self.app.screen_height)
+        time_marker = self.app.layer_cache.get(("time marker", size), lambda: create_filled_surface(size, (255, 255, 255, 100), pg.SRCALPHA))
         screen.blit(time_marker, (self.app.screen_width * self.activation_proportion, 0))
 
     def draw_chord_lines(self, current_chords, exit_timestamp):
@@ -517,8 +902,8 @@ class ClassicVisualisation(Visualisation):
     def draw_chord_line(self, x_pos):
         """Each line will show where each chord begins."""
         
-        chord_line = pg.Surface((1, self.app.screen_height), pg.SRCALPHA)
-        chord_line.fill((255, 255, 255, 50))
+        size = (1, self.app.screen_height)
+        chord_line = self.app.layer_cache.get(("chord line", size), lambda: create_filled_surface(size, (255, 255, 255, 50), pg.SRCALPHA))
         screen.blit(chord_line, (x_pos, 0))
 
     def draw_margin(self, not_hidden=True):
@@ -526,10 +911,12 @@ class ClassicVisualisation(Visualisation):
         
         margin_height = self.app.edge_margin_proportion * self.app.screen_height
         
-        self.top_margin = pg.Surface((self.app.screen_width, margin_height))
-        self.top_margin.fill(self.app.theme.margin_color)
-        self.bottom_margin = pg.Surface((self.app.screen_width, margin_height))
-        self.bottom_margin.fill(self.app.theme.margin_color)
+        size = (self.app.screen_width, margin_height)
+        margin_color = self.app.theme.margin_color
+
+        # Both margins are the same, but they are kept as separate surfaces in case one of them changes
+        self.top_margin = self.app.layer_cache.get(("top margin", size, margin_color), lambda: create_filled_surface(size, margin_color))
+        self.bottom_margin = self.app.layer_cache.get(("bottom margin", size, margin_color), lambda: create_filled_surface(size, margin_color))
 
         if not_hidden:
             screen.blit(self.top_margin, (0, 0))
@@ -554,6 +941,7 @@ class HindsightVisualisation(ClassicVisualisation):
 class StaticVisualisation(ClassicVisualisation):
 
     name = "Static"
+    is_scrolling = False
 
     def __init__(self, app):        
         self.app = app
@@ -565,9 +953,14 @@ class StaticVisualisation(ClassicVisualisation):
         if self.activation_proportion >= 1:
             self.activation_proportion -= 1
 
+    def set_time_marker(self, time_elapsed):
+        """Places the time marker where it would be after moving for time_elapsed seconds from the start."""
+        self.activation_proportion = ((time_elapsed * self.pixels_per_second) / self.app.screen_width) % 1
+
 class DriftVisualisation(ClassicVisualisation):
 
     name = "Drift"
+    is_scrolling = False
 
     def __init__(self, app):        
         self.app = app
@@ -579,16 +972,245 @@ class DriftVisualisation(ClassicVisualisation):
         if self.activation_proportion >= 1:
             self.activation_proportion -= 1
 
+    def set_time_marker(self, time_elapsed):
+        """Places the time marker where it would be after moving for time_elapsed seconds from the start."""
+        self.activation_proportion = ((time_elapsed * self.pixels_per_second * 0.75) / self.app.screen_width) % 1
+
 
 VISUALISATIONS = [ClassicVisualisation, SynthesiaVisualisation, ForesightVisualisation, HindsightVisualisation, StaticVisualisation, DriftVisualisation]
 VISUALISATION_NAME_DCT = {vis.name:vis for vis in VISUALISATIONS}
 
 
+def rasterise_rects(surface, xs, ys, widths, heights, colors, is_vertical):
+    """
+    Fills rectangles straight into the pixels of a surface with NumPy, giving the same result as
+    calling pg.draw.rect for each rectangle in order (later rectangles are drawn on top).
+
+    Rectangles which share the same extent across the screen (e.g. notes with the same pitch)
+    form a lane, and along a lane each rectangle covers a span of positions. Every position of
+    every lane is given the index of the last rectangle which covers it, and the lanes are then
+    painted with the colours of those rectangles.
+    """
+    pixels = pg.surfarray.pixels3d(surface) # Indexed as [x, y]
+
+    # Work in [along the lane, across the lanes] coordinates
+    if is_vertical:
+        pixels = pixels.transpose(1, 0, 2)
+        span_starts, span_lengths, lane_starts, lane_widths = ys, heights, xs, widths
+    else:
+        span_starts, span_lengths, lane_starts, lane_widths = xs, widths, ys, heights
+    lane_length, across_length = pixels.shape[:2]
+
+    # Clip everything to the surface, like pg.draw.rect does
+    span_ends = np.minimum(span_starts + span_lengths, lane_length)
+    span_starts = np.maximum(span_starts, 0)
+    lane_ends = np.minimum(lane_starts + lane_widths, across_length)
+    lane_starts = np.maximum(lane_starts, 0)
+    is_visible = (span_starts < span_ends) & (lane_starts < lane_ends)
+    if not is_visible.any():
+        return
+    orders = np.flatnonzero(is_visible)
+    span_starts, span_ends = span_starts[orders], span_ends[orders]
+    lane_keys, lane_nos = np.unique(lane_starts[orders] * (across_length + 1) + lane_ends[orders], return_inverse=True)
+    lane_bounds = np.stack(np.divmod(lane_keys, across_length + 1), axis=1)
+
+    # One cell per position of each lane, listing every (cell, rectangle) pair
+    span_lengths = span_ends - span_starts
+    first_cells = lane_nos * lane_length + span_starts
+    cell_offsets = np.arange(span_lengths.sum()) - np.repeat(np.cumsum(span_lengths) - span_lengths, span_lengths)
+    cells = np.repeat(first_cells, span_lengths) + cell_offsets
+    cell_orders = np.repeat(orders, span_lengths)
+
+    # Where rectangles overlap, the one drawn last has the highest order
+    owners = np.full(len(lane_bounds) * lane_length, -1)
+    np.maximum.at(owners, cells, cell_orders)
+    owners = owners.reshape(len(lane_bounds), lane_length)
+
+    # Rounding can make neighbouring lanes share a few pixels, where the rectangle drawn last also wins
+    boundaries = np.unique(lane_bounds).tolist()
+    for band_start, band_end in zip(boundaries, boundaries[1:]):
+        is_covering = (lane_bounds[:, 0] <= band_start) & (lane_bounds[:, 1] >= band_end)
+        if not is_covering.any():
+            continue
+        band_owners = owners[is_covering].max(axis=0)
+        positions = np.flatnonzero(band_owners >= 0)
+        pixels[positions, band_start:band_end] = colors[band_owners[positions]][:, np.newaxis, :]
+
+
+class NoteAtlas:
+    """
+    In the scrolling visualisations, notes only move along the screen between frames.
+    Instead of drawing every note on every frame, the notes are drawn once into tiles which
+    each cover TILE_LENGTH pixels of time at the current zoom. Each frame only blits the tiles
+    which are on screen and then draws the currently active notes on top of them.
+
+    Tiles are placed on a pixel grid which starts at time 0, so neighbouring tiles and the
+    active notes always line up exactly.
+    """
+
+    TILE_LENGTH = 256
+
+    def __init__(self, app):
+        self.app = app
+        self.tiles = collections.OrderedDict()
+        self.layout = None
+
+    def clear(self):
+        self.tiles = collections.OrderedDict()
+
+    @property
+    def transparent_color(self):
+        """A colour which none of the notes use, so that it can be made transparent."""
+        note_colors = {note_color for note_color, activated_color in self.app.track_palette.values()}
+        return next(color for color in [(255, 0, 255), (0, 255, 1), (1, 2, 3)] if color not in note_colors)
+
+    def get_layout(self, visualisation, pitch_min, pitch_max, width, roundedness):
+        """Everything that the tiles are drawn from apart from the notes and their colours."""
+        return (
+            visualisation.name,
+            self.app.screen_width,
+            self.app.screen_height,
+            visualisation.pixels_per_second,
+            pitch_min,
+            pitch_max,
+            width,
+            roundedness,
+            self.app.should_draw_margin,
+            self.app.edge_margin_proportion,
+            self.app.pixels_to_remove_between_consecutive_notes,
+            self.app.pixels_to_remove_between_simultaneous_notes,
+            self.app.can_merge_notes,
+        )
+
+    @property
+    def max_tiles(self):
+        """Enough tiles to cover the screen twice, so tiles which just scrolled off can be reused when going backwards."""
+        screen_length = max(self.app.screen_width, self.app.screen_height)
+        return 2 * (screen_length // self.TILE_LENGTH + 2)
+
+    def draw_notes(self, visualisation, time, exit_timestamp, entry_timestamp, pitch_min, pitch_max, width, roundedness):
+        layout = self.get_layout(visualisation, pitch_min, pitch_max, width, roundedness)
+        if layout != self.layout:
+            self.clear()
+            self.layout = layout
+
+        # Tile i covers the pixels from i * TILE_LENGTH up to (i + 1) * TILE_LENGTH on the grid
+        if visualisation.is_vertical:
+            edge_pixel = int(visualisation.snap_to_pixels(entry_timestamp))
+            first_tile = (edge_pixel - self.app.screen_height) // self.TILE_LENGTH
+            last_tile = edge_pixel // self.TILE_LENGTH
+        else:
+            edge_pixel = int(visualisation.snap_to_pixels(exit_timestamp))
+            first_tile = edge_pixel // self.TILE_LENGTH
+            last_tile = (edge_pixel + self.app.screen_width) // self.TILE_LENGTH
+
+        for tile_index in range(first_tile, last_tile + 1):
+            tile = self.get_tile(tile_index, visualisation, pitch_min, pitch_max, width, roundedness)
+            if visualisation.is_vertical:
+                screen.blit(tile, (0, edge_pixel - (tile_index + 1) * self.TILE_LENGTH))
+            else:
+                screen.blit(tile, (tile_index * self.TILE_LENGTH - edge_pixel, 0))
+
+        self.draw_active_notes(visualisation, time, edge_pixel, pitch_min, pitch_max, width, roundedness)
+
+    def get_tile(self, tile_index, visualisation, pitch_min, pitch_max, width, roundedness):
+        if tile_index in self.tiles:
+            self.tiles.move_to_end(tile_index)
+            return self.tiles[tile_index]
+
+        if visualisation.is_vertical:
+            size = (self.app.screen_width, self.TILE_LENGTH)
+            tile_edge_pixel = (tile_index + 1) * self.TILE_LENGTH
+        else:
+            size = (self.TILE_LENGTH, self.app.screen_height)
+            tile_edge_pixel = tile_index * self.TILE_LENGTH
+
+        tile = self.draw_layer(size, tile_index * self.TILE_LENGTH, (tile_index + 1) * self.TILE_LENGTH, tile_edge_pixel, visualisation, pitch_min, pitch_max, width, roundedness)
+        self.tiles[tile_index] = tile
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def draw_layer(self, size, first_pixel, last_pixel, edge_pixel, visualisation, pitch_min, pitch_max, width, roundedness):
+        """
+        Draws the notes between first_pixel and last_pixel on the grid onto a transparent surface,
+        where edge_pixel is the grid position of the surface's left edge (or bottom edge when vertical).
+        """
+        layer = pg.Surface(size)
+        layer.fill(self.transparent_color)
+
+        # A couple of spare pixels on each side catch notes which only poke into the layer after rounding
+        pixels_per_second = visualisation.pixels_per_second
+        notes = self.app.get_drawn_notes(pixels_per_second)
+        indices = notes.get_indices_between((first_pixel - 2) / pixels_per_second, (last_pixel + 2) / pixels_per_second)
+        layer_notes = notes.take(sort_into_drawing_order(notes, indices))
+
+        xs, ys, widths, heights = visualisation.get_snapped_note_rects(layer_notes, pitch_min, pitch_max, edge_pixel)
+        for x_pos, y_pos, note_width, note_height, track in zip(xs.tolist(), ys.tolist(), widths.tolist(), heights.tolist(), layer_notes.track.tolist()):
+            note_color, activated_color = self.app.track_palette[track]
+            pg.draw.rect(layer, note_color, [x_pos, y_pos, note_width, note_height], width=width, border_radius=roundedness)
+
+        # Colour keys are much quicker to blit than per pixel alpha
+        layer.set_colorkey(self.transparent_color, pg.RLEACCEL)
+        return layer
+
+    def draw_active_notes(self, visualisation, time, edge_pixel, pitch_min, pitch_max, width, roundedness):
+        if time == 0:
+            return
+
+        active_notes = self.app.song.get_active_notes(time)
+        xs, ys, widths, heights = visualisation.get_snapped_note_rects(active_notes, pitch_min, pitch_max, edge_pixel)
+        for x_pos, y_pos, note_width, note_height, track in zip(xs.tolist(), ys.tolist(), widths.tolist(), heights.tolist(), active_notes.track.tolist()):
+            note_color, activated_color = self.app.track_palette[track]
+            pg.draw.rect(screen, activated_color, [x_pos, y_pos, note_width, note_height], width=width, border_radius=roundedness)
+
+class NotePages(NoteAtlas):
+    """
+    In the Static visualisation, the notes stay still while the time marker moves across the screen,
+    until it reaches the end and the next page of notes replaces them. Each page is drawn once,
+    so a frame only blits the page and draws the active notes on top of it.
+
+    The next page is drawn on a frame which only had to blit its page, so that turning the page
+    does not take any longer than an ordinary frame.
+    """
+
+    # The previous, current and next pages
+    MAX_PAGES = 3
+
+    def draw_notes(self, visualisation, time, exit_timestamp, entry_timestamp, pitch_min, pitch_max, width, roundedness):
+        layout = self.get_layout(visualisation, pitch_min, pitch_max, width, roundedness)
+        if layout != self.layout:
+            self.clear()
+            self.layout = layout
+
+        # Pages are keyed by the grid position of their left edge, which is the same on every frame of a page
+        edge_pixel = int(visualisation.snap_to_pixels(exit_timestamp))
+        is_cached = edge_pixel in self.tiles
+        screen.blit(self.get_page(edge_pixel, visualisation, pitch_min, pitch_max, width, roundedness), (0, 0))
+        self.draw_active_notes(visualisation, time, edge_pixel, pitch_min, pitch_max, width, roundedness)
+
+        next_edge_pixel = int(visualisation.snap_to_pixels(exit_timestamp + self.app.note_travel_time))
+        if is_cached and next_edge_pixel not in self.tiles:
+            self.get_page(next_edge_pixel, visualisation, pitch_min, pitch_max, width, roundedness)
+
+    def get_page(self, edge_pixel, visualisation, pitch_min, pitch_max, width, roundedness):
+        if edge_pixel in self.tiles:
+            self.tiles.move_to_end(edge_pixel)
+            return self.tiles[edge_pixel]
+
+        page = self.draw_layer(screen.get_size(), edge_pixel, edge_pixel + self.app.screen_width, edge_pixel, visualisation, pitch_min, pitch_max, width, roundedness)
+        self.tiles[edge_pixel] = page
+        while len(self.tiles) > self.MAX_PAGES:
+            self.tiles.popitem(last=False)
+        return page
+
 class VisualisationRunner:
     def __init__(self, app, visualisation):
         self.app = app
         self.visualisation = visualisation
         self.has_initialised_export = False
+        self.note_atlas = NoteAtlas(app)
+        self.note_pages = NotePages(app)
         
     @property
     def current_to_exit_time(self):
@@ -601,62 +1223,45 @@ class VisualisationRunner:
         """How long it takes for a note to travel from entering to the current time."""
         
         return self.app.note_travel_time * (1 - self.visualisation.activation_proportion)
+
+    @property
+    def video_end_time(self):
+        """The time at which the visualisation stops."""
+
+        if self.app.notes_end_offscreen:
+            return self.app.song.end_time + self.current_to_exit_time
+        else:
+            return self.app.song.end_time
         
     def init_video(self):
         """This will activate all the settings necessary before you start the visualisation"""
 
-        # Reset note colors when selecting new theme
-        self.app.track_colors = {}
-        
-        self.app.note_tracks, self.app.tempo_bpm, self.app.resolution = self.app.read_midi(self.app.filename)
-        calculate_note_times(self.app.note_tracks, self.app.tempo_bpm, self.app.resolution)
-        self.app.chords = self.app.fetch_chords()
+        self.app.load_song()
         self.app.play_from_start()
-            
-        # Calculate the min and max pitches for the new MIDI track
-        self.pitch_min, self.pitch_max = get_pitch_min_max(self.app.note_tracks)
-        config = self.app.config
-
-        # Calculate the end time for the new MIDI track
-        self.app.end_time = get_maximum_time(self.app.note_tracks)
-        self.clear_notes()
-
-    def clear_notes(self):
-        """This function is used so that the notes can be recalculated to be put on screen."""
-
-        self.current_note_indices = [[0 for i in range(128)] for k in range(len(self.app.note_tracks))]
 
     def export_video(self):
         if not self.has_initialised_export:
             self.init_video()
             self.has_initialised_export = True
-            self.app.time = self.app.start_time
-            delete_and_create_folders()
             self.frame = 0
+            self.set_frame_time(self.frame)
+
+            if self.app.export_mode == "Pipe":
+                self.video_pipe = VideoPipe(self.app.video_path, screen.get_size(), self.app.frame_rate)
+            else:
+                delete_and_create_folders()
+                self.frame_writer = FrameWriter(self.app.frame_writer_threads, self.app.frame_queue_depth)
             
         else:
     
             dt = 1 / self.app.frame_rate # time elapsed between frames
-
-            if self.app.notes_end_offscreen:
-                end_time = self.app.end_time + self.current_to_exit_time
-            else:
-                end_time = self.app.end_time
+            end_time = self.video_end_time
             
             # So that the last frame isn't skipped
             if self.app.time - dt <= end_time:
                 print(f"Current: {self.app.time:.2f}\tFrame: {self.frame:04}\tEnd time: ({end_time:.2f})")
 
-                # Timestamps of the very edges of the screen
-                self.exit_timestamp = self.app.time - self.current_to_exit_time
-                self.entry_timestamp = self.app.time + self.entry_to_current_time
-
-                self.get_current_items_on_screen()
-                self.draw_frame()
-
-                if self.visualisation.name in ["Static", "Drift"]:
-                    self.visualisation.move_time_marker(dt)
-                    self.clear_notes()
+                self.render_current_frame()
 
                 self.save_current_frame()
             else:
@@ -665,10 +1270,47 @@ class VisualisationRunner:
     def convert_to_video(self):
         self.app.exporting_video = False
         self.has_initialised_export = False
-        print("Done! Converting to video...")
-        self.run_ffmpeg()
+        with self.app.profiler.finishing_stage("ffmpeg"):
+            if self.app.export_mode == "Pipe":
+                print("Done! Finishing encoding...")
+                self.video_pipe.close()
+            else:
+                print("Done! Converting to video...")
+                self.frame_writer.close()
+                self.run_ffmpeg()
         print("All complete!")
 
+    def render_current_frame(self):
+        # Timestamps of the very edges of the screen
+        self.exit_timestamp = self.app.time - self.current_to_exit_time
+        self.entry_timestamp = self.app.time + self.entry_to_current_time
+
+        with self.app.profiler.stage("items"):
+            self.get_current_items_on_screen()
+        self.draw_frame()
+
+    def set_frame_time(self, frame):
+        """
+        Jumps straight to the time of a frame in the video, rather than accumulating the time of every frame before it.
+        This allows separate processes to render different parts of the same video.
+        """
+        time_elapsed = frame / self.app.frame_rate
+        self.app.time = self.app.start_time + time_elapsed
+
+        if self.visualisation.name in ["Static", "Drift"]:
+            self.visualisation.set_time_marker(time_elapsed)
+
+    def count_video_frames(self):
+        """The number of frames that export_video would save."""
+
+        dt = 1 / self.app.frame_rate
+        frame = 0
+        while True:
+            self.set_frame_time(frame)
+            if self.app.time - dt > self.video_end_time:
+                return frame
+            frame += 1
+
     def run_ffmpeg(self):
         """
         Convert all images into a video.
@@ -696,117 +1338,173 @@ class VisualisationRunner:
         #call_list.append("audio.mp3")
         #call_list.append("-c:a copy -shortest")
         
-        call_list.append("-vcodec")
-        call_list.append("libx264")
-        call_list.append("-crf")
-        call_list.append("25")
-        call_list.append("-pix_fmt")
-        call_list.append("yuv420p")
-        call_list.append("-vf")
-        call_list.append("crop=trunc(iw/2)*2:trunc(ih/2)*2")
-        call_list.append("-y") # Always overwrite
-        call_list.append(self.app.video_path)
+        call_list.extend(get_ffmpeg_output_args(self.app.video_path))
 
         print(call_list)
         subprocess.call(call_list)
                     
       
-    def draw_video(self, dt, play_sound):
+    def draw_video(self, play_sound):
+        playback_clock = self.app.playback_clock
+
         if not self.app.has_initialised_video:
             self.init_video()
             self.app.has_initialised_video = True
+            playback_clock.stop()
+            playback_clock.reset_counters()
 
             if play_sound:
                 pg.mixer.music.load(self.app.filename)
                 pg.mixer.music.play()
-                self.app.loading_audio = True
+                playback_clock.start(self.app.time, follow_audio=True)
 
         else:
-            # Timestamps of the very edges of the screen
-            self.entry_timestamp = self.app.time + self.entry_to_current_time
-            self.exit_timestamp = self.app.time - self.current_to_exit_time
-
-            self.get_current_items_on_screen()
-            self.draw_frame()
+            if not self.app.is_paused or self.app.in_playback_mode:
+                previous_time = self.app.time
+                self.app.time = playback_clock.tick(self.app.time, self.app.frame_rate)
+                self.app.profiler.count("dropped_frames", playback_clock.frames_dropped_last_tick)
 
-            if self.app.notes_end_offscreen:
-                end_time = self.app.end_time + self.current_to_exit_time
+                if self.visualisation.name in ["Static", "Drift"]:
+                    self.visualisation.move_time_marker(self.app.time - previous_time)
             else:
-                end_time = self.app.end_time
+                playback_clock.stop()
 
+            end_time = self.video_end_time
 
             if self.app.time >= end_time:
                 self.app.is_paused = True
                 self.app.time = end_time
 
-            if not self.app.is_paused or self.app.in_playback_mode:
-                self.app.time += (dt / 1000)
+            # Timestamps of the very edges of the screen
+            self.entry_timestamp = self.app.time + self.entry_to_current_time
+            self.exit_timestamp = self.app.time - self.current_to_exit_time
 
-                if self.visualisation.name in ["Static", "Drift"]:
-                    self.visualisation.move_time_marker(dt / 1000)
-                    self.clear_notes()
+            with self.app.profiler.stage("items"):
+                self.get_current_items_on_screen()
+            self.draw_frame()
 
     def draw_frame(self):
         rounded_options = {"Not Rounded": 0, "Slightly Rounded": 3, "Very Rounded": 8}
-        
-        self.visualisation.draw_notes(
-            self.app.current_notes,
-            self.app.time,
-            self.exit_timestamp,
-            self.entry_timestamp,
-            self.pitch_min,
-            self.pitch_max,
-            0 if self.app.are_notes_filled else 1,
-            rounded_options[self.app.roundedness]
-        )
+        profiler = self.app.profiler
+        profiler.count("notes", len(self.app.current_notes))
+        profiler.count("chords", len(self.app.current_chords))
 
-        if self.app.time_marker_enabled:
-            self.visualisation.draw_time_marker()
+        with profiler.stage("notes"):
+            self.draw_notes(rounded_options)
 
-        if self.app.chord_lines_enabled:
-            if self.visualisation.name == "Synthesia":
-                timestamp = self.entry_timestamp
-            else:
-                timestamp = self.exit_timestamp
-                
-            self.visualisation.draw_chord_lines(self.app.current_chords, timestamp)
+        with profiler.stage("markers"):
+            if self.app.time_marker_enabled:
+                self.visualisation.draw_time_marker()
 
-        self.visualisation.draw_margin(not_hidden=self.app.should_draw_margin)
+            if self.app.chord_lines_enabled:
+                if self.visualisation.name == "Synthesia":
+                    timestamp = self.entry_timestamp
+                else:
+                    timestamp = self.exit_timestamp
+                    
+                self.visualisation.draw_chord_lines(self.app.current_chords, timestamp)
+
+        with profiler.stage("margin"):
+            self.visualisation.draw_margin(not_hidden=self.app.should_draw_margin)
 
         if not self.app.chord_style == 'Disabled':
-            self.visualisation.draw_chords(
-                self.app.current_chords,
+            with profiler.stage("chords"):
+                self.visualisation.draw_chords(
+                    self.app.current_chords,
+                    self.app.time,
+                    self.exit_timestamp,
+                    self.entry_timestamp,
+                )
+
+    def draw_notes(self, rounded_options):
+        # Joined up notes would be lit up for their whole length, so they are all drawn unlit (nothing is lit
+        # up at time 0) and the notes which really are playing are drawn over them afterwards
+        is_merged = self.app.current_notes_are_merged
+        note_time = 0 if is_merged else self.app.time
+
+        if self.app.note_renderer == "NumPy" and self.app.are_notes_filled and self.app.roundedness == "Not Rounded":
+            self.rasterise_notes(note_time)
+            if is_merged:
+                self.draw_active_notes()
+        elif self.app.note_renderer == "Atlas":
+            # Drift's notes still move, just more slowly than the time marker, so it uses the tiles
+            note_cache = self.note_pages if self.visualisation.name == "Static" else self.note_atlas
+            note_cache.draw_notes(
+                self.visualisation,
                 self.app.time,
                 self.exit_timestamp,
                 self.entry_timestamp,
+                self.app.song.pitch_min,
+                self.app.song.pitch_max,
+                0 if self.app.are_notes_filled else 1,
+                rounded_options[self.app.roundedness]
+            )
+        else:
+            self.visualisation.draw_notes(
+                self.app.current_notes,
+                note_time,
+                self.exit_timestamp,
+                self.entry_timestamp,
+                self.app.song.pitch_min,
+                self.app.song.pitch_max,
+                0 if self.app.are_notes_filled else 1,
+                rounded_options[self.app.roundedness]
             )
+            if is_merged:
+                self.draw_active_notes()
+
+    @property
+    def edge_timestamp(self):
+        """The timestamp which note positions are measured from: the top of the screen when vertical, otherwise the left."""
+        if self.visualisation.is_vertical:
+            return self.entry_timestamp
+        return self.exit_timestamp
+
+    def draw_active_notes(self):
+        """Draws the notes which are playing on top of the joined up notes, taking them from all of the song's notes."""
+        time = self.app.time
+        if time == 0:
+            return
+
+        active_notes = self.app.song.get_active_notes(time)
+        xs, ys, widths, heights = self.visualisation.get_note_rects(active_notes, self.app.song.pitch_min, self.app.song.pitch_max, self.edge_timestamp)
+        for x_pos, y_pos, note_width, note_height, track in zip(xs.tolist(), ys.tolist(), widths.tolist(), heights.tolist(), active_notes.track.tolist()):
+            note_color, activated_color = self.app.track_palette[track]
+            pg.draw.rect(screen, activated_color, [x_pos, y_pos, note_width, note_height])
+
+    def rasterise_notes(self, time):
+        """Draws the notes on screen with rasterise_rects instead of one pg.draw.rect call per note."""
+
+        notes = self.app.current_notes
+        xs, ys, widths, heights = self.visualisation.get_note_rects(notes, self.app.song.pitch_min, self.app.song.pitch_max, self.edge_timestamp)
+
+        # Look up both colours of each track, then choose between them for every note
+        track_colors = np.zeros((max(self.app.track_palette, default=0) + 1, 2, 3), dtype=np.uint8)
+        for track, colors in self.app.track_palette.items():
+            track_colors[track] = colors
+        is_active = (notes.start_time <= time) & (notes.end_time >= time) & (time != 0)
+        colors = track_colors[notes.track, is_active.astype(np.intp)]
+
+        rasterise_rects(screen, xs, ys, widths, heights, colors, self.visualisation.is_vertical)
 
     def save_current_frame(self):
-        screencopy = screen.copy()
-        pg.image.save(screencopy, f"tmp_images/{self.frame:08}.jpg")
+        with self.app.profiler.stage("save"):
+            if self.app.export_mode == "Pipe":
+                self.video_pipe.write(screen)
+            else:
+                self.frame_writer.write(screen, f"tmp_images/{self.frame:08}.jpg")
         self.frame += 1
-        self.app.time += 1 / self.app.frame_rate
+        self.set_frame_time(self.frame)
         
     def get_current_items_on_screen(self):
         """Prepares the variables for the frame to be drawn"""
 
         # Timestamps are in seconds
-        self.app.current_notes = []
-        for track_index, track in enumerate(self.app.note_tracks):
-            for pitch_index in range(128):
-                min_note_index = self.current_note_indices[track_index][pitch_index]
-                max_note_index = len(track[pitch_index])
-                for note_index in range(min_note_index, max_note_index):
-                    note = track[pitch_index][note_index]
-
-                    # Remove notes which are off the screen
-                    if note.end_time < self.exit_timestamp:
-                        self.current_note_indices[track_index][pitch_index] += 1
-
-                    elif note.start_time < self.entry_timestamp:
-                        self.app.current_notes.append(note)
-                    else:
-                        break
+        notes = self.app.get_drawn_notes(self.visualisation.pixels_per_second)
+        indices = notes.get_indices_between(self.exit_timestamp, self.entry_timestamp)
+
+        self.app.current_notes = notes.take(sort_into_drawing_order(notes, indices))
+        self.app.current_notes_are_merged = notes is not self.app.song.notes
 
         self.app.current_chords = []
         for chord in self.app.chords:
@@ -814,7 +1512,14 @@ class VisualisationRunner:
                 self.app.current_chords.append(chord)
           
 class Application:
-    def __init__(self, config):
+    def __init__(self, config, screen_size=None, headless=False):
+        """
+        Opens the window (or the headless display) at screen_size.
+        Without a screen_size, a display which is already open is kept, and otherwise one of the default size is opened.
+        """
+        if screen_size is not None or screen is None:
+            init_display(*(screen_size or (DEFAULT_SCREEN_WIDTH, DEFAULT_SCREEN_HEIGHT)), headless=headless)
+
         self.running = True
         self.clock = pg.time.Clock()
         self.filename = None
@@ -823,9 +1528,9 @@ class Application:
         self.has_initialised_video = False
 
         # Parameters
-        self.note_tracks = None
-        self.tempo_bpm = None
-        self.resolution = None
+        self.song = None # Stays loaded until a different file is opened
+        self.current_notes_are_merged = False
+        self.track_colors = {}
         self.config = config
 
         # Margin and sizes
@@ -833,6 +1538,7 @@ class Application:
 
         # Colors
         self.theme = THEMES[config["theme"]]
+        self.track_theme_colors = None # The order of the theme's colours when the tracks were coloured
 
         # Notes
         self.pixels_to_remove_between_consecutive_notes = int(config["pixels_to_remove_between_consecutive_notes"])
@@ -840,6 +1546,7 @@ class Application:
         self.roundedness = config["roundedness"]
         self.are_notes_filled = config["are_notes_filled"].lower() == 'true'
         self.activation_brightness = float(config["activation_brightness"])
+        self.note_renderer = config.get("note_renderer", "Atlas")
 
         # Timings
         self.frame_rate = int(config["frame_rate"])
@@ -865,6 +1572,12 @@ class Application:
         # Video
         self.folder_to_save = config["folder_to_save"]
         self.file_name = config["file_name"]
+        # Settings files saved before these options existed use the same defaults as options.cfg
+        self.export_mode = config.get("export_mode", "Pipe")
+        self.frame_writer_threads = int(config.get("frame_writer_threads", 4))
+        self.frame_queue_depth = int(config.get("frame_queue_depth", 16))
+        self.midi_parser = config.get("midi_parser", "Native")
+        self.output_path = None # Overrides the folder and file name when rendering from the command line
         self.exporting_video = False
         self.in_playback_mode = False # where you can hear the midi sound
         self.should_draw_margin = config["should_draw_margin"].lower() == 'true'
@@ -874,10 +1587,17 @@ class Application:
         # Visualisation
         self.visualisation = VISUALISATION_NAME_DCT[config["visualisation"]](self)
         self.render_engine = VisualisationRunner(self, self.visualisation)
+        self.layer_cache = LayerCache()
+        self.song_cache = midi_parser.SongCache()
+        self.profiler = frame_profiler.FrameProfiler()
+        self.show_profiler_overlay = False
+        self.last_render_key = None # What the frame on screen was drawn from, see get_render_key
+        self.screen_width = None
+        self.screen_height = None
         self.update_screen_size()
 
-        # Audio
-        self.loading_audio = False # So that the visualisation waits until the audio finishes loading before starting
+        # Where the song is while it plays live
+        self.playback_clock = PlaybackClock()
 
         # Configuration
         self.last_selected_tab = 0 # Select the first tab as the default
@@ -888,10 +1608,21 @@ class Application:
 
     @property
     def video_path(self):
+        if self.output_path is not None:
+            return self.output_path
         return os.path.join(self.folder_to_save, self.file_name) + '.mp4'
         
     def update_screen_size(self):
-        self.screen_width, self.screen_height = pg.display.get_surface().get_size()
+        """Returns whether the size of the screen has changed since the last time this was called."""
+
+        screen_size = pg.display.get_surface().get_size()
+        has_changed = screen_size != (self.screen_width, self.screen_height)
+        self.screen_width, self.screen_height = screen_size
+
+        if has_changed:
+            clear_chord_text_cache()
+            self.layer_cache.clear()
+        return has_changed
 
     def prompt_config_change(self):
         config = {
@@ -911,11 +1642,16 @@ class Application:
             "time_marker_enabled": self.time_marker_enabled,
             "activation_brightness": self.activation_brightness,
             "notes_end_offscreen": self.notes_end_offscreen,
+            "note_renderer": self.note_renderer,
             
             "frame_rate": self.frame_rate,
             "seconds_before_start": self.seconds_before_start,            
             "file_name": self.file_name,
             "folder_to_save": self.folder_to_save,
+            "export_mode": self.export_mode,
+            "frame_writer_threads": self.frame_writer_threads,
+            "frame_queue_depth": self.frame_queue_depth,
+            "midi_parser": self.midi_parser,
             "chord_path": self.chord_path,
 
             "last_selected_tab": self.last_selected_tab,
@@ -927,8 +1663,28 @@ class Application:
         self.update_config(config)
 
     def update_config(self, config):
-        vis = config["visualisation"]
-        self.visualisation = VISUALISATION_NAME_DCT[vis](self)
+        """
+        Applies the settings from the config menu. The song stays loaded unless the MIDI parser
+        changed, and only the parts of the visualisation which depend on a changed setting are reset.
+        """
+        theme_changed = config["theme"] is not self.theme
+        # Shuffling or reordering a theme changes its colours in place
+        colors_changed = (theme_changed or config["theme"].current_colors != self.track_theme_colors
+                          or config["activation_brightness"] != self.activation_brightness)
+        previous_parser = self.midi_parser
+        parser_changed = config["midi_parser"] != previous_parser
+        chords_changed = config["chord_path"] != self.chord_path
+        visualisation_changed = config["visualisation"] != self.visualisation.name
+
+        # The cached layers are drawn from these settings
+        if theme_changed or config["edge_margin_proportion"] != self.edge_margin_proportion:
+            self.layer_cache.clear()
+        if theme_changed:
+            clear_chord_text_cache()
+
+        if visualisation_changed:
+            self.visualisation = VISUALISATION_NAME_DCT[config["visualisation"]](self)
+            self.render_engine.visualisation = self.visualisation
         self.chord_style = config["chord_style"]
         
         self.edge_margin_proportion = config["edge_margin_proportion"]
@@ -944,36 +1700,69 @@ class Application:
         self.time_marker_enabled = config["time_marker_enabled"]
         self.activation_brightness = config["activation_brightness"]
         self.notes_end_offscreen = config["notes_end_offscreen"]
+        self.note_renderer = config["note_renderer"]
         
         self.frame_rate = config["frame_rate"]
         self.seconds_before_start = config["seconds_before_start"]
         self.file_name = config["file_name"]
         self.folder_to_save = config["folder_to_save"]
+        self.export_mode = config["export_mode"]
+        self.frame_writer_threads = config["frame_writer_threads"]
+        self.frame_queue_depth = config["frame_queue_depth"]
+        self.midi_parser = config["midi_parser"]
         self.chord_path = config["chord_path"]
 
         self.last_selected_tab = config["last_selected_tab"]
         self.theme = config["theme"]
 
-        if self.tempo_bpm is not None:
-
-            self.chords = self.fetch_chords()
+        if self.song is not None:
+            if parser_changed:
+                previous_song, self.song = self.song, None
+                try:
+                    self.load_song()
+                except ImportError as e:
+                    # Keep the song from the parser which worked, rather than being left without one
+                    self.song = previous_song
+                    self.midi_parser = previous_parser
+                    load_tkinter()
+                    top = tk.Tk()
+                    top.withdraw()  # hide window
+                    tk.messagebox.showerror(title="Missing Library!", message=f"The {config['midi_parser']} parser could not be loaded ({e}).\nStill using the {previous_parser} parser.", parent=top)
+                    top.destroy()
+            if colors_changed:
+                self.update_track_colors()
+            if chords_changed:
+                self.chords = self.fetch_chords()
             
             # Allow for the static command to have snapped zooming features
             if self.visualisation.name == "Static":
-                bps = self.tempo_bpm / 60
+                bps = self.song.tempo_map.get_tempo_bpm_at(self.time) / 60
                 beat_duration = 1 / bps
                 self.note_travel_time = beat_duration * 4
 
-        self.has_initialised_video = False
+        # The time marker of a new visualisation starts where it would have been if it had been used from the start
+        if visualisation_changed and not self.visualisation.is_scrolling:
+            self.visualisation.set_time_marker(self.time - self.start_time)
+
+        # Any setting can change how the frame looks
+        self.last_render_key = None
         
         
-    def event_loop(self):
-        for event in pg.event.get():
+    def event_loop(self, wait_for_event=False):
+        events = pg.event.get()
+        if wait_for_event and not events:
+            events = [pg.event.wait()]
+
+        for event in events:
             if event.type == pg.QUIT:
                 self.running = False
                 self.quit()
                 return
 
+            # The window was uncovered, so its contents have to be drawn again
+            if event.type in [pg.VIDEOEXPOSE, pg.WINDOWEXPOSED]:
+                self.last_render_key = None
+
             mods = pg.key.get_mods()
             
             if event.type == pg.KEYDOWN:
@@ -983,13 +1772,18 @@ class Application:
                     
                     if not self.exporting_video:
                         config = self.prompt_config_change()
-                        self.render_engine = VisualisationRunner(self, self.visualisation)
-                        self.has_initialised_video = False
                         self.is_paused = True
 
                 # Pausing
                 if event.key == pg.K_SPACE:
                     self.is_paused = not self.is_paused
+
+                # Frame timings
+                if event.key == pg.K_F3:
+                    self.show_profiler_overlay = not self.show_profiler_overlay
+                    self.profiler.enabled = self.show_profiler_overlay
+                if event.key == pg.K_F4:
+                    self.profiler.write_report(PROFILE_REPORT_PATH)
                 
                 # Ctrl + Something key bindings
 
@@ -1008,10 +1802,15 @@ class Application:
                             self.zoom_in()
     
                         # Hold to time skip
-                        if event.key == pg.K_LEFT:
-                            self.left_key_held = True
-                        if event.key == pg.K_RIGHT:
-                            self.right_key_held = True
+                        if not mods & pg.KMOD_SHIFT:
+                            if event.key == pg.K_LEFT:
+                                self.left_key_held = True
+                            if event.key == pg.K_RIGHT:
+                                self.right_key_held = True
+
+                        # Go to a time typed in
+                        if event.key == pg.K_g and not self.exporting_video and not self.in_playback_mode:
+                            self.prompt_seek()
 
                         # Exporting video
                         if event.key == pg.K_s:
@@ -1020,6 +1819,7 @@ class Application:
 
                                 # Ask user before potentially overwriting file
                                 if os.path.isfile(self.video_path):
+                                    load_tkinter()
                                     top = tk.Tk()
                                     top.withdraw()  # hide window
                                     
@@ -1046,9 +1846,19 @@ class Application:
                         if event.key == pg.K_END:
                             self.play_from_end()
                         if event.key == pg.K_LEFT:
-                            self.skip_to_nearest_previous_note()  
+                            if mods & pg.KMOD_SHIFT:
+                                self.skip_to_previous("beat_times")
+                            else:
+                                self.skip_to_nearest_previous_note()
                         if event.key == pg.K_RIGHT:
-                            self.skip_to_nearest_next_note()
+                            if mods & pg.KMOD_SHIFT:
+                                self.skip_to_next("beat_times")
+                            else:
+                                self.skip_to_nearest_next_note()
+                        if event.key == pg.K_PAGEUP:
+                            self.skip_to_previous("bar_times")
+                        if event.key == pg.K_PAGEDOWN:
+                            self.skip_to_next("bar_times")
 
                     # Play with sound lol
                     if event.key == pg.K_p:
@@ -1081,14 +1891,12 @@ class Application:
             self.note_travel_time /= 2
         else:
             self.note_travel_time /= 1.3
-        self.render_engine.clear_notes()
 
     def zoom_out(self):
         if self.visualisation.name == "Static":
             self.note_travel_time *= 2
         else:
             self.note_travel_time *= 1.3
-        self.render_engine.clear_notes()
         
     def handle_arrow_keys(self):
         if self.left_key_held:
@@ -1098,106 +1906,134 @@ class Application:
             
     def play_from_start(self):
         self.time = self.start_time
-        self.render_engine.clear_notes()
         self.is_paused = True
 
         if self.visualisation.name in ["Static", "Drift"]:
             self.visualisation.activation_proportion = 0
 
     def play_from_end(self):
-        self.time = self.end_time
-        self.render_engine.clear_notes()
+        # The song can be unloaded by a key press earlier in the same batch of events
+        if self.song is None:
+            return
+
+        self.time = self.song.end_time
         self.is_paused = True
         
-    def skip_to_nearest_previous_note(self):
-        lst = sorted(self.current_notes, key=lambda x: x.start_time, reverse=True)
+    def jump_to(self, time):
+        """Pauses at a time in the song, wherever it is on the screen."""
+        self.time = time
+        self.is_paused = True
+
+        # The time marker goes where it would have been if the song had played up to here
+        if not self.visualisation.is_scrolling:
+            self.visualisation.set_time_marker(self.time - self.start_time)
+
+    def skip_to_previous(self, times_name):
+        """Jumps to the latest of the song's onsets, beat_times or bar_times before the current time."""
+        # The song can be unloaded by a key press earlier in the same batch of events
+        if self.song is None:
+            return
 
         # Allow for users to go to the very start if the recording starts before the first note
-        if self.time == 0:
-            self.time = self.start_time
-            self.render_engine.clear_notes()
-            self.is_paused = True
+        previous_time = get_previous_time(getattr(self.song, times_name), self.time)
+        self.jump_to(previous_time if previous_time is not None and previous_time >= self.start_time else self.start_time)
+
+    def skip_to_next(self, times_name):
+        """Jumps to the earliest of the song's onsets, beat_times or bar_times after the current time."""
+        if self.song is None:
             return
-        
-        for note in lst:
-            if note.start_time < self.time:
-                self.time = note.start_time
-                self.render_engine.clear_notes()
-                self.is_paused = True
-                return
+
+        next_time = get_next_time(getattr(self.song, times_name), self.time)
+        if next_time is not None and next_time <= self.song.end_time:
+            self.jump_to(next_time)
+
+    def skip_to_nearest_previous_note(self):
+        self.skip_to_previous("onsets")
 
     def skip_to_nearest_next_note(self):
-        lst = sorted(self.current_notes, key=lambda x: x.start_time)
-        
-        for note in lst:
-            if note.start_time > self.time:
-                self.time = note.start_time
-                self.render_engine.clear_notes()
-                self.is_paused = True
-                return
+        self.skip_to_next("onsets")
 
-    def read_midi(self, filename):
+    def seek(self, timestamp):
         """
-        Returns a list of tracks.
-        Each track is a list containing 128 lists of notes.
+        Jumps to a time given in seconds or as a string such as "1:23".
+        Times before the start or after the end of the song are moved to the start or end.
         """
-        midi_tracks = midi.read_midifile(filename)
-        resolution = midi_tracks.resolution
-        tempo_bpm = 120.0  # may be changed repeatedly in the loop
-        note_tracks = []
+        if isinstance(timestamp, str):
+            timestamp = parse_timestamp(timestamp)
+        if self.song is None:
+            return
+        self.jump_to(min(max(timestamp, self.start_time), self.song.end_time))
+
+    def prompt_seek(self):
+        load_tkinter()
+        top = tk.Tk()
+        top.withdraw()  # hide window
+        timestamp = tk.simpledialog.askstring(title="Go To Time", prompt="Time to go to (e.g. 1:23.5):", parent=top)
+
+        if timestamp:
+            try:
+                self.seek(timestamp)
+            except ValueError as e:
+                tk.messagebox.showerror(title="Invalid Time!", message=str(e))
+        top.destroy()
+
+    def read_midi(self, filename):
+        """Returns a Song containing every note in the file, sorted by when the notes start."""
+        parsed = midi_parser.read_midi_file(filename, self.midi_parser, cache=self.song_cache)
+        tempo_map = note.TempoMap(parsed.resolution, parsed.tempo_changes)
+        return Song(filename, parsed.notes, tempo_map, parsed.time_signatures)
+
+    def load_song(self):
+        """Reads the chosen MIDI file, unless it is already loaded."""
+        if self.song is not None and self.song.filename == self.filename:
+            return
+
+        self.song = self.read_midi(self.filename)
+        self.update_track_colors()
+        self.chords = self.fetch_chords()
+
+    @property
+    def can_merge_notes(self):
+        """Joined up notes only look the same as the notes they replace when the notes are solid rectangles with no gaps."""
+        return self.are_notes_filled and self.roundedness == "Not Rounded" and self.pixels_to_remove_between_consecutive_notes == 0
+
+    def get_drawn_notes(self, pixels_per_second):
+        """The song's notes, or simpler joined up notes when zoomed out far enough for them to look the same."""
+        if self.can_merge_notes:
+            return self.song.get_notes_at_zoom(pixels_per_second)
+        return self.song.notes
+
+    def update_track_colors(self):
+        """Every track with notes gets the next colour of the theme."""
+        self.track_colors = {}
         colors = self.theme.current_colors
-        
-        for t_index, t in enumerate(midi_tracks):
-            notes_pitchwise = [[] for i in range(128)]
-            total_ticks = 0
-            for elem in t:
-                total_ticks += elem.tick
-                if elem.name in ["Note On", "Note Off"]:
-                    pitch = elem.data[0]
-                    if is_note_on(elem):
-                        n = note.Note(
-                            velocity=elem.data[1],
-                            pitch=pitch,
-                            start_ticks=total_ticks,
-                            track=t_index)
-                        notes_pitchwise[pitch].append(n)
-
-                        if t_index not in self.track_colors:
-                            self.track_colors[t_index] = colors[0]
-                            colors = colors[1:] + [colors[0]]
-                            
-                    else:
-                        for n in reversed(notes_pitchwise[pitch]):
-                            if not n.finished:
-                                n.end_ticks = total_ticks
-                                n.finished = True
-                            else:
-                                break
-                elif elem.name == "Set Tempo":
-                    tempo_bpm = elem.get_bpm()
-            note_tracks.append(notes_pitchwise)
+        self.track_theme_colors = list(colors)
+        for t_index in self.song.tracks:
+            self.track_colors[t_index] = colors[0]
+            colors = colors[1:] + [colors[0]]
 
-        return note_tracks, tempo_bpm, resolution
+        self.track_palette = compile_track_palette(self.track_colors, self.activation_brightness)
+        self.render_engine.note_atlas.clear()
+        self.render_engine.note_pages.clear()
 
-    def parse_chords(self, chords, tempo_bpm):
+    def parse_chords(self, chords, tempo_map):
         """Returns a list of chord objects which include their text and their starting and ending times"""
 
-        crotchet_duration = 60 / tempo_bpm # How long a single crotchet beat takes in seconds
-
+        # How many crotchet beats each chord lasts for
         CHORD_DURATIONS = {
-            'a': crotchet_duration * 0.25,
-            'b': crotchet_duration * 0.5,
-            'c': crotchet_duration * 1,
-            'd': crotchet_duration * 2,
-            'e': crotchet_duration * 4,
-            'f': crotchet_duration / 6,
-            'g': crotchet_duration / 3,
-            'h': crotchet_duration / 1.5,
-            'i': crotchet_duration * 0.125
+            'a': 0.25,
+            'b': 0.5,
+            'c': 1,
+            'd': 2,
+            'e': 4,
+            'f': 1 / 6,
+            'g': 1 / 3,
+            'h': 1 / 1.5,
+            'i': 0.125
         }
 
-        time_elapsed = 0
-        chord_output = []
+        texts = []
+        beats_elapsed = [0]
         
         for chord in chords:
             match = re.match('^(.+)\[(.+)\]$', chord)
@@ -1213,16 +2049,18 @@ class Application:
             else:
                 chord_duration = CHORD_DURATIONS[duration]
 
-            chord = Chord(text, time_elapsed, time_elapsed+chord_duration, self)
-            chord_output.append(chord)
-            time_elapsed += chord_duration
+            texts.append(text)
+            beats_elapsed.append(beats_elapsed[-1] + chord_duration)
 
-        return chord_output
+        # Convert every chord's beats into seconds at once, so that the chords follow any tempo changes
+        times = tempo_map.beats_to_seconds(beats_elapsed).tolist()
+        return [Chord(text, start_time, end_time, self) for text, start_time, end_time in zip(texts, times, times[1:])]
 
     def prompt_file(self):            
         """Create a Tk file dialog and cleanup when finished"""
 
         self.previous_file = self.filename
+        load_tkinter()
         top = tk.Tk()
         top.withdraw()  # hide window
         
@@ -1241,70 +2079,211 @@ class Application:
         self.filename = self.prompt_file()
 
         if self.filename:
+            self.song = None # Read the file again, even if it is the one already loaded, in case it has been edited
             self.has_initialised_video = False
             
         # If the user cancels the dialogue box, but something is already loaded, keep it
         elif self.previous_file:
             self.filename = self.previous_file
-            self.render_engine.clear_notes()
 
     def fetch_chords(self):
-        return self.parse_chords(get_chords(self.chord_path), self.tempo_bpm)
+        return self.parse_chords(get_chords(self.chord_path), self.song.tempo_map)
 
     def hide_margin(self):
         self.visualisation.top_margin.set_alpha(0)
         self.visualisation.bottom_margin.set_alpha(0)
 
+    def create_gradient(self, size):
+        top_color, bottom_color = self.theme.bg_color
+        
+        colour_rect = pg.Surface((2, 2))
+        pg.draw.line(colour_rect, top_color, (0,0), (1,0))  
+        pg.draw.line(colour_rect, bottom_color, (0,1), (1,1))
+        return pg.transform.smoothscale(colour_rect, size)  # stretch!
+
     def draw_bg(self):
             
         if len(self.theme.bg_color) == 2:
-            top_color, bottom_color = self.theme.bg_color
-            
-            colour_rect = pg.Surface((2, 2))
-            pg.draw.line(colour_rect, top_color, (0,0), (1,0))  
-            pg.draw.line(colour_rect, bottom_color, (0,1), (1,1))
-            colour_rect = pg.transform.smoothscale(colour_rect, (self.screen_width, self.screen_height))  # stretch!
-            screen.blit(colour_rect, (0, 0))
+            size = (self.screen_width, self.screen_height)
+            background = self.layer_cache.get(("background", size, tuple(self.theme.bg_color)), lambda: self.create_gradient(size))
+            screen.blit(background, (0, 0))
 
         else:
             screen.fill(self.theme.bg_color)
         
             
+    def get_render_key(self):
+        """
+        Everything the live frame is drawn from, apart from the settings (update_config forgets the last key instead).
+        While the key stays the same, the frame on screen is still correct and does not need to be drawn again.
+        """
+        return (
+            self.filename,
+            self.song,
+            self.time,
+            self.note_travel_time,
+            self.screen_width,
+            self.screen_height,
+            self.visualisation,
+            getattr(self.visualisation, "activation_proportion", None),
+            self.is_paused,
+            self.in_playback_mode,
+            self.has_initialised_video,
+            self.show_profiler_overlay,
+        )
+
     def run(self):
         while self.running:
-            dt = self.clock.tick(self.frame_rate)
+            self.clock.tick(self.frame_rate)
 
-            if self.loading_audio:
-                dt = 0
-                self.loading_audio = False
-                
-            self.draw_bg()
             self.update_screen_size()
             self.handle_arrow_keys()
+
+            # Nothing has changed since the last frame, so sleep until there is an event rather than drawing it again
+            render_key = self.get_render_key()
+            if render_key == self.last_render_key and not self.exporting_video:
+                self.event_loop(wait_for_event=True)
+                continue
+            self.last_render_key = render_key
+
+            self.profiler.start_frame(self.time)
+            with self.profiler.stage("background"):
+                self.draw_bg()
             
             if self.filename:
                 if self.exporting_video:
                     self.render_engine.export_video()
                 else:
-                    self.render_engine.draw_video(dt, play_sound=self.in_playback_mode)
+                    self.render_engine.draw_video(play_sound=self.in_playback_mode)
             else:
                 if self.time_marker_enabled:
                     self.render_engine.visualisation.draw_time_marker()
                 self.visualisation.draw_margin(not_hidden=self.should_draw_margin)
-            
-            pg.display.update()
+
+            if self.show_profiler_overlay:
+                self.draw_profiler_overlay()
+
+            with self.profiler.stage("display"):
+                pg.display.update()
+            if self.playback_clock.is_running:
+                self.playback_clock.frame_shown(self.time)
+                self.profiler.count("drift_ms", self.playback_clock.drift * 1000)
+            self.profiler.end_frame()
             self.event_loop()
 
+    def draw_profiler_overlay(self):
+        """Shows how long each stage of the latest frames took in the top left corner."""
+        summary = self.profiler.get_summary(frame_profiler.OVERLAY_WINDOW)
+        lines = [f"{'stage':<10}{'p50':>8}{'p95':>8}{'max':>8}  ms"]
+        for name, stats in summary.items():
+            lines.append(f"{name:<10}{stats['p50']:>8.2f}{stats['p95']:>8.2f}{stats['max']:>8.2f}")
+        if self.profiler.frames:
+            counts = self.profiler.frames[-1]["counts"]
+            lines.append(f"notes {counts.get('notes', 0)}  chords {counts.get('chords', 0)}")
+
+        clock = self.playback_clock
+        if clock.frames:
+            lines.append(f"late {clock.late_frames}/{clock.frames}  dropped {clock.dropped_frames}")
+            lines.append(f"drift {clock.drift * 1000:.1f} ms (max {clock.max_drift * 1000:.1f})  resyncs {clock.audio_resyncs}")
+
+        font = get_font("Consolas", 14)
+        line_height = font.get_linesize()
+        rendered_lines = [font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max(line.get_width() for line in rendered_lines) + 10
+        background = create_filled_surface((width, line_height * len(lines) + 10), (0, 0, 0))
+        background.set_alpha(180)
+        screen.blit(background, (0, 0))
+        for i, line in enumerate(rendered_lines):
+            screen.blit(line, (5, 5 + i * line_height))
+
+    def render(self, filename, output_path):
+        """
+        Exports a video without the event loop or the frame rate clock,
+        so that frames are rendered as fast as possible.
+        """
+        self.filename = filename
+        self.output_path = output_path
+        self.exporting_video = True
+
+        # The first call sets up the export, so that the profiler's frame numbers match the video's
+        self.render_engine.export_video()
+        while self.exporting_video:
+            self.profiler.start_frame(self.time)
+            with self.profiler.stage("background"):
+                self.draw_bg()
+            self.render_engine.export_video()
+            self.profiler.end_frame()
+        self.profiler.stop_cprofile()
+
+    def render_in_parallel(self, filename, output_path, jobs):
+        """
+        Splits the video into one segment per job, renders each segment in its own process
+        and then joins the segments together without re-encoding them.
+        """
+        self.filename = filename
+        self.output_path = output_path
+        self.render_engine.init_video()
+        frame_count = self.render_engine.count_video_frames()
+
+        # Every segment gets a contiguous range of frames
+        boundaries = [round(i * frame_count / jobs) for i in range(jobs + 1)]
+        frame_ranges = [(first, last) for first, last in zip(boundaries, boundaries[1:]) if first < last]
+
+        with tempfile.TemporaryDirectory() as segment_folder:
+            segment_paths = [os.path.join(segment_folder, f"{i:04}.mp4") for i in range(len(frame_ranges))]
+            segment_jobs = [
+                (dict(self.config), filename, path, first, last, screen.get_size())
+                for path, (first, last) in zip(segment_paths, frame_ranges)
+            ]
+
+            print(f"Rendering {frame_count} frames in {len(segment_jobs)} segments...")
+            with multiprocessing.get_context("spawn").Pool(len(segment_jobs)) as pool:
+                pool.starmap(render_video_segment, segment_jobs)
+
+            print("Done! Joining segments...")
+            concat_list_path = os.path.join(segment_folder, "segments.txt")
+            with open(concat_list_path, 'w') as f:
+                for path in segment_paths:
+                    f.write(f"file '{path}'\n")
+
+            call_list = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_list_path, "-c", "copy", "-y", output_path]
+            print(call_list)
+            subprocess.call(call_list)
+
+        print("All complete!")
+
     def quit(self):
         self.running = False
         pg.quit()
 
+def render_video_segment(config, filename, segment_path, first_frame, last_frame, size):
+    """Renders the frames from first_frame up to (but not including) last_frame into their own video."""
+
+    app = Application(config, size, headless=True)
+    app.filename = filename
+    render_engine = app.render_engine
+    render_engine.init_video()
+
+    video_pipe = VideoPipe(segment_path, size, app.frame_rate)
+    for frame in range(first_frame, last_frame):
+        render_engine.set_frame_time(frame)
+        app.draw_bg()
+        render_engine.render_current_frame()
+        video_pipe.write(screen)
+    video_pipe.close()
+
+    print(f"Finished frames {first_frame} to {last_frame - 1}")
+    pg.quit()
+
 class ConfigMenu:
     vis_names = [vis.name for vis in VISUALISATIONS]
     rounded_options = ["Not Rounded", "Slightly Rounded", "Very Rounded"]
     chord_styles = ["Disabled", "Static", "Dynamic", "Dynamic Inline"]
     chord_side_options = ["Top", "Bottom"]
+    note_renderers = ["Pygame", "Atlas", "NumPy"]
     frame_rates = [24, 30, 50, 60]
+    export_modes = ["Pipe", "Images"]
+    midi_parsers = list(midi_parser.BACKENDS.keys())
     theme_list = list(THEMES.keys())
 
     def __init__(self, config):
@@ -1326,11 +2305,16 @@ class ConfigMenu:
         self.time_marker_enabled = config["time_marker_enabled"]
         self.activation_brightness = config["activation_brightness"]
         self.notes_end_offscreen = config["notes_end_offscreen"]
+        self.note_renderer = config["note_renderer"]
         
         self.seconds_before_start = config["seconds_before_start"]
         self.frame_rate = config["frame_rate"]
         self.file_name = config["file_name"]
         self.folder_to_save = config["folder_to_save"]
+        self.export_mode = config["export_mode"]
+        self.frame_writer_threads = config["frame_writer_threads"]
+        self.frame_queue_depth = config["frame_queue_depth"]
+        self.midi_parser = config["midi_parser"]
         self.chord_path = config["chord_path"]
 
         self.last_selected_tab = config["last_selected_tab"]
@@ -1339,6 +2323,7 @@ class ConfigMenu:
         self.run()
 
     def run(self):
+        load_tkinter()
         self.root = tk.Tk()
         self.root.focus_force()
         
@@ -1402,6 +2387,7 @@ class ConfigMenu:
         ttk.Label(tab3, text="Chord Side").grid(column=0, row=5)
         ttk.Label(tab3, text="Note Activation Brightness").grid(column=0, row=6)
         ttk.Label(tab3, text="Notes End Offscreen?").grid(column=0, row=7)
+        ttk.Label(tab3, text="Note Renderer").grid(column=0, row=8)
         
 
         self.filled_in_input = ttk.Checkbutton(tab3)
@@ -1412,6 +2398,7 @@ class ConfigMenu:
         self.time_marker_input = ttk.Checkbutton(tab3)
         self.activation_brightness_input = ttk.Spinbox(tab3, from_=-1, to=1, increment=0.1, state="readonly")
         self.notes_end_input = ttk.Checkbutton(tab3)
+        self.note_renderer_input = ttk.Combobox(tab3, values=self.note_renderers, state="readonly")
 
         button_state = {True: 'selected', False: '!selected'}
         self.filled_in_input.state([button_state[self.are_notes_filled]])
@@ -1422,6 +2409,7 @@ class ConfigMenu:
         self.time_marker_input.state([button_state[self.time_marker_enabled]])
         self.activation_brightness_input.set(self.activation_brightness)
         self.notes_end_input.state([button_state[self.notes_end_offscreen]])
+        self.note_renderer_input.set(self.note_renderer)
         
 
         self.filled_in_input.grid(column=1, row=0)
@@ -1432,12 +2420,17 @@ class ConfigMenu:
         self.chord_side_input.grid(column=1, row=5)
         self.activation_brightness_input.grid(column=1, row=6)
         self.notes_end_input.grid(column=1, row=7)
+        self.note_renderer_input.grid(column=1, row=8)
         
 
         # Tab 4
         ttk.Label(tab4, text="Frame Rate").grid(column=0, row=0)
         ttk.Label(tab4, text="Seconds Before Start").grid(column=0, row=1)
         ttk.Label(tab4, text="Filename (.mp4)").grid(column=0, row=2)
+        ttk.Label(tab4, text="Export Mode").grid(column=0, row=5)
+        ttk.Label(tab4, text="MIDI Parser").grid(column=0, row=6)
+        ttk.Label(tab4, text="Image Writer Threads").grid(column=0, row=7)
+        ttk.Label(tab4, text="Image Queue Depth").grid(column=0, row=8)
         
         self.folder_text = ttk.Label(tab4, text=f"Folder To Save In: {self.folder_to_save}")
         self.folder_text.grid(column=0, row=3)
@@ -1449,17 +2442,29 @@ class ConfigMenu:
         self.file_name_input = ttk.Entry(tab4)
         self.folder_browse_button = ttk.Button(tab4, text="Browse", command=self.prompt_folder_selection)
         self.chord_browse_button = ttk.Button(tab4, text="Browse", command=self.prompt_file_selection)
+        self.export_mode_input = ttk.Combobox(tab4, values=self.export_modes, state="readonly")
+        self.midi_parser_input = ttk.Combobox(tab4, values=self.midi_parsers, state="readonly")
+        self.frame_writer_threads_input = ttk.Spinbox(tab4, from_=1, to=16, increment=1, state="readonly")
+        self.frame_queue_depth_input = ttk.Spinbox(tab4, from_=1, to=64, increment=1, state="readonly")
 
         # You do not need to set a default for the file browsing, since the only input was a button
         self.frame_rate_input.set(self.frame_rate)
         self.seconds_before_input.set(self.seconds_before_start)
         self.file_name_input.insert(0, self.file_name)
+        self.export_mode_input.set(self.export_mode)
+        self.midi_parser_input.set(self.midi_parser)
+        self.frame_writer_threads_input.set(self.frame_writer_threads)
+        self.frame_queue_depth_input.set(self.frame_queue_depth)
 
         self.frame_rate_input.grid(column=1, row=0)
         self.seconds_before_input.grid(column=1, row=1)
         self.file_name_input.grid(column=1, row=2)
         self.folder_browse_button.grid(column=1, row=3)
         self.chord_browse_button.grid(column=1, row=4)
+        self.export_mode_input.grid(column=1, row=5)
+        self.midi_parser_input.grid(column=1, row=6)
+        self.frame_writer_threads_input.grid(column=1, row=7)
+        self.frame_queue_depth_input.grid(column=1, row=8)
 
         # Tab 5
         """
@@ -1626,10 +2631,15 @@ class ConfigMenu:
         self.time_marker_enabled = 'selected' in self.time_marker_input.state()
         self.activation_brightness = float(self.activation_brightness_input.get())
         self.notes_end_offscreen = 'selected' in self.notes_end_input.state()
+        self.note_renderer = self.note_renderer_input.get()
 
         # Tab 4
         self.frame_rate = int(self.frame_rate_input.get())
         self.seconds_before_start = float(self.seconds_before_input.get())
+        self.export_mode = self.export_mode_input.get()
+        self.midi_parser = self.midi_parser_input.get()
+        self.frame_writer_threads = int(self.frame_writer_threads_input.get())
+        self.frame_queue_depth = int(self.frame_queue_depth_input.get())
 
         # Tab 5
         self.theme = THEMES[self.theme_menu.get()]
@@ -1670,11 +2680,16 @@ class ConfigMenu:
             "time_marker_enabled": self.time_marker_enabled,
             "activation_brightness": self.activation_brightness,
             "notes_end_offscreen": self.notes_end_offscreen,
+            "note_renderer": self.note_renderer,
             
             "frame_rate": self.frame_rate,
             "seconds_before_start": self.seconds_before_start,            
             "file_name": self.file_name,
             "folder_to_save": self.folder_to_save,
+            "export_mode": self.export_mode,
+            "frame_writer_threads": self.frame_writer_threads,
+            "frame_queue_depth": self.frame_queue_depth,
+            "midi_parser": self.midi_parser,
             "chord_path": self.chord_path,
 
             "last_selected_tab": self.last_selected_tab,
@@ -1689,10 +2704,79 @@ class ConfigMenu:
         
         return config
     
-if __name__ == '__main__':
-    
-    config = get_config("options.cfg")["DEFAULT"]
-    app = Application(config)
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="midi_visualiser", description="Visualise MIDI files in real time or render them to videos.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    render_parser = subparsers.add_parser("render", help="Render a MIDI file to a video without opening a window.")
+    render_parser.add_argument("midi_file", help="The MIDI file to visualise.")
+    render_parser.add_argument("-c", "--config", default="options.cfg", help="The settings file to use (default: options.cfg).")
+    render_parser.add_argument("-o", "--output", help="Where to save the video (default: the folder and file name from the settings).")
+    render_parser.add_argument("--chords", help="The chord file to use instead of the one in the settings.")
+    render_parser.add_argument("--width", type=int, default=DEFAULT_SCREEN_WIDTH, help="Width of the video in pixels.")
+    render_parser.add_argument("--height", type=int, default=DEFAULT_SCREEN_HEIGHT, help="Height of the video in pixels.")
+    render_parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes which render separate segments of the video at the same time.")
+    render_parser.add_argument("--profile-report", help="Save how long each stage of every frame took to a .csv or .json file.")
+    render_parser.add_argument("--cprofile", metavar="FIRST:LAST", help="Run cProfile over a range of frames, e.g. 100:200.")
+    render_parser.add_argument("--cprofile-output", default="frames.pstats", help="Where to save the cProfile capture (default: frames.pstats).")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "render":
+        if not os.path.isfile(args.midi_file):
+            parser.error(f"{args.midi_file} does not exist!")
+        if not os.path.isfile(args.config):
+            parser.error(f"{args.config} does not exist!")
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1!")
+        if args.jobs > 1 and (args.profile_report or args.cprofile):
+            parser.error("Profiling only works when rendering with one job!")
+        if args.cprofile is not None:
+            match = re.match(r"^(\d+):(\d+)$", args.cprofile)
+            if not match or int(match.group(1)) > int(match.group(2)):
+                parser.error("--cprofile must be a range of frames such as 100:200!")
+            args.cprofile = (int(match.group(1)), int(match.group(2)))
+
+    return args
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.command == "render":
+        config = get_config(args.config)["DEFAULT"]
+        if args.chords is not None:
+            config["chord_path"] = args.chords
+
+        app = Application(config, (args.width, args.height), headless=True)
+
+        output_path = args.output if args.output is not None else app.video_path
+        if os.path.dirname(output_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        if args.profile_report:
+            app.profiler.enabled = True
+        if args.cprofile is not None:
+            app.profiler.enable_cprofile(*args.cprofile, args.cprofile_output)
+
+        if args.jobs > 1:
+            app.render_in_parallel(args.midi_file, output_path, args.jobs)
+        else:
+            app.render(args.midi_file, output_path)
 
-    # Default render engine which runs on start up
-    app.run()
+        if args.profile_report:
+            app.profiler.write_report(args.profile_report)
+            for name, stats in app.profiler.get_summary().items():
+                print(f"{name:<10} p50 {stats['p50']:.2f} ms\tp95 {stats['p95']:.2f} ms\tmax {stats['max']:.2f} ms")
+            for name, seconds in app.profiler.finishing.items():
+                print(f"{name:<10} {seconds * 1000:.2f} ms after the last frame")
+        app.quit()
+
+    else:
+        config = get_config("options.cfg")["DEFAULT"]
+        app = Application(config)
+
+        # Default render engine which runs on start up
+        app.run()
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,301 @@
-class Note:
+import collections
+import math
+
+import numpy as np
+
+# Notes shorter than this share a group in the index, since splitting tiny notes up further would not save any time
+MIN_INDEXED_DURATION = 1 / 64
+
+# Merging notes less than 2 ** MIN_MERGE_LEVEL seconds apart would hardly ever join any of them
+MIN_MERGE_LEVEL = -6
+
+# The tempo that MIDI files play at until they set one
+DEFAULT_TEMPO_BPM = 120.0
+
+# The (numerator, denominator) that MIDI files are in until they set a time signature
+DEFAULT_TIME_SIGNATURE = (4, 4)
+
+
+class NoteArray:
+    """
+    All the notes of a song, stored column by column.
+    Each attribute is an array with one element per note, so that
+    the note at index i has the pitch pitch[i], the track track[i], etc.
+    """
+
     def __init__(
             self,
-            velocity=127,
-            pitch=50,
-            start_ticks=0,
-            end_ticks=0,
-            start_time=0.0,
-            end_time=0.0,
-            track=0,
-            finished=False):
-        self.velocity = velocity
-        self.pitch = pitch
-        self.start_ticks = start_ticks
-        self.end_ticks = end_ticks
-        self.start_time = start_time
-        self.end_time = end_time
-        self.track = track
-        self.finished = finished
-
-    def calculate_start_and_end_time(self, tempo_bpm, resolution):
-        self.start_time = get_time_of_ticks(
-            self.start_ticks, resolution, tempo_bpm)
-        self.end_time = get_time_of_ticks(
-            self.end_ticks, resolution, tempo_bpm)
-
-
-def get_time_of_ticks(ticks, resolution, tempo_bpm):
-    time_per_beat = 60.0 / tempo_bpm
-    time_per_tick = time_per_beat / resolution
-    return time_per_tick * ticks
+            pitch,
+            velocity,
+            track,
+            start_ticks,
+            end_ticks,
+            start_time=None,
+            end_time=None):
+        self.pitch = np.asarray(pitch, dtype=np.uint8)
+        self.velocity = np.asarray(velocity, dtype=np.uint8)
+        self.track = np.asarray(track, dtype=np.int32)
+        self.start_ticks = np.asarray(start_ticks, dtype=np.int64)
+        self.end_ticks = np.asarray(end_ticks, dtype=np.int64)
+
+        if start_time is None:
+            start_time = np.zeros(len(self.pitch))
+        if end_time is None:
+            end_time = np.zeros(len(self.pitch))
+        self.start_time = np.asarray(start_time, dtype=np.float64)
+        self.end_time = np.asarray(end_time, dtype=np.float64)
+
+        # Built the first time it is needed, since notes are often taken from a NoteArray just to be drawn
+        self.duration_groups = None
+
+    def __len__(self):
+        return len(self.pitch)
+
+    def __repr__(self):
+        return f"NoteArray({len(self)} notes)"
+
+    def take(self, indices):
+        """Returns a new NoteArray which only contains the notes at the given indices."""
+        return NoteArray(
+            self.pitch[indices],
+            self.velocity[indices],
+            self.track[indices],
+            self.start_ticks[indices],
+            self.end_ticks[indices],
+            self.start_time[indices],
+            self.end_time[indices])
+
+    @staticmethod
+    def concatenate(note_arrays):
+        """Joins several NoteArrays into one, keeping their order."""
+        columns = ["pitch", "velocity", "track", "start_ticks", "end_ticks", "start_time", "end_time"]
+        return NoteArray(*[np.concatenate([getattr(notes, column) for notes in note_arrays]) for column in columns])
+
+    def sorted_by_onset(self):
+        """Notes which start at the same time are ordered by track and then by pitch."""
+        return self.take(np.lexsort((self.pitch, self.track, self.start_ticks)))
+
+    def calculate_start_and_end_time(self, tempo_map):
+        self.start_time = tempo_map.ticks_to_seconds(self.start_ticks)
+        self.end_time = tempo_map.ticks_to_seconds(self.end_ticks)
+        self.duration_groups = None
+
+    def build_index(self):
+        """
+        Splits the notes into groups of similar durations.
+        Within a group, every note which is sounding at a certain time must have started
+        at most the group's longest duration before it, so a binary search on the start times
+        finds all of them. Grouping stops a few very long notes from making every search
+        look through all of the short notes around them.
+        """
+        durations = np.maximum(self.end_time - self.start_time, 0)
+        duration_classes = np.ceil(np.log2(np.maximum(durations, MIN_INDEXED_DURATION)))
+
+        self.duration_groups = []
+        for duration_class in np.unique(duration_classes):
+            indices = np.flatnonzero(duration_classes == duration_class)
+            self.duration_groups.append((
+                indices,
+                self.start_time[indices],
+                self.end_time[indices],
+                durations[indices].max()))
+
+    def get_indices_between(self, start_time, end_time):
+        """
+        Returns the sorted indices of the notes which end at or after start_time and start before end_time.
+        This takes O(log n + k) time, whatever the previous search was.
+        """
+        if self.duration_groups is None:
+            self.build_index()
+
+        found_indices = [np.array([], dtype=np.intp)]
+        for indices, start_times, end_times, max_duration in self.duration_groups:
+            first = np.searchsorted(start_times, start_time - max_duration)
+            last = np.searchsorted(start_times, end_time)
+            is_sounding = end_times[first:last] >= start_time
+            found_indices.append(indices[first:last][is_sounding])
+
+        return np.sort(np.concatenate(found_indices))
+
+
+def merge_close_notes(notes, max_gap):
+    """
+    Returns a NoteArray in which the notes of each track and pitch that overlap, or that are less than max_gap seconds
+    apart, have been joined into one long note. Each joined note keeps the velocity of the first note in it.
+    The start and end times of the notes must already have been calculated.
+    """
+    if len(notes) == 0:
+        return notes
+
+    order = np.lexsort((notes.start_time, notes.pitch, notes.track))
+    notes = notes.take(order)
+    is_new_lane = np.concatenate([[True], (notes.track[1:] != notes.track[:-1]) | (notes.pitch[1:] != notes.pitch[:-1])])
+
+    # The latest end of the notes so far in each lane. Every lane is offset by more than the length of the song,
+    # so that one accumulated maximum covers every lane without the lanes affecting each other
+    lane_offsets = (np.cumsum(is_new_lane) - 1) * (notes.end_time.max() - notes.start_time.min() + 1)
+    lane_end_times = np.maximum.accumulate(notes.end_time + lane_offsets) - lane_offsets
+
+    is_new_note = is_new_lane.copy()
+    is_new_note[1:] |= notes.start_time[1:] - lane_end_times[:-1] >= max_gap
+    firsts = np.flatnonzero(is_new_note)
+
+    return NoteArray(
+        notes.pitch[firsts],
+        notes.velocity[firsts],
+        notes.track[firsts],
+        notes.start_ticks[firsts],
+        np.maximum.reduceat(notes.end_ticks, firsts),
+        notes.start_time[firsts],
+        np.maximum.reduceat(notes.end_time, firsts)).sorted_by_onset()
+
+
+class NoteLevels:
+    """
+    Simpler copies of a song's notes for zoomed out views, where thousands of notes can be
+    narrower than a pixel. At level k, notes of the same track and pitch which are less than
+    2 ** k seconds apart are joined together, so each level has fewer notes than the one below it.
+    Levels are only made the first time they are used.
+    """
+
+    def __init__(self, notes):
+        self.notes = notes
+        self.levels = {}
+
+    @staticmethod
+    def choose_level(pixels_per_second, max_gap_pixels):
+        """The coarsest level whose joined up gaps are at most max_gap_pixels wide, or None if that would join nothing."""
+        level = math.floor(math.log2(max_gap_pixels / pixels_per_second))
+        return level if level >= MIN_MERGE_LEVEL else None
+
+    def get_level(self, level):
+        if level not in self.levels:
+            self.levels[level] = merge_close_notes(self.notes, 2.0 ** level)
+        return self.levels[level]
+
+
+class NotePairer:
+    """
+    Pairs the note on and note off events of a MIDI file into notes, one event at a time.
+    Each channel and pitch has its own queue of notes which are still being held,
+    and a note off event finishes the oldest of them, so a note which is played again
+    before it is released still ends where the first note off says.
+    """
+
+    def __init__(self):
+        # The columns of the NoteArray
+        self.pitches = []
+        self.velocities = []
+        self.tracks = []
+        self.start_ticks = []
+        self.end_ticks = []
+
+        self.open_notes = collections.defaultdict(collections.deque) # Indices of the unfinished notes for each (channel, pitch)
+
+        self.paired_count = 0
+        self.dangling_count = 0 # Notes which were never turned off
+        self.unmatched_off_count = 0 # Note offs without a note to turn off
+
+    def note_on(self, track, channel, pitch, velocity, tick):
+        self.open_notes[(channel, pitch)].append(len(self.pitches))
+        self.pitches.append(pitch)
+        self.velocities.append(velocity)
+        self.tracks.append(track)
+        self.start_ticks.append(tick)
+        self.end_ticks.append(tick)
+
+    def note_off(self, channel, pitch, tick):
+        held_notes = self.open_notes.get((channel, pitch))
+        if held_notes:
+            self.end_ticks[held_notes.popleft()] = tick
+            self.paired_count += 1
+        else:
+            self.unmatched_off_count += 1
+
+    def end_track(self, tick):
+        """Finishes every note which is still being held when its track ends."""
+        for held_notes in self.open_notes.values():
+            for i in held_notes:
+                self.end_ticks[i] = tick
+            self.dangling_count += len(held_notes)
+        self.open_notes.clear()
+
+    def get_notes(self):
+        return NoteArray(self.pitches, self.velocities, self.tracks, self.start_ticks, self.end_ticks)
+
+    def get_counts(self):
+        return self.paired_count, self.dangling_count, self.unmatched_off_count
+
+    def get_summary(self):
+        return get_pairing_summary(*self.get_counts())
+
+
+def get_pairing_summary(paired_count, dangling_count, unmatched_off_count):
+    return (
+        f"{paired_count} notes paired, "
+        f"{dangling_count} notes held until the end of their track, "
+        f"{unmatched_off_count} note offs without a note")
+
+
+class TempoMap:
+    """
+    Converts between ticks and seconds in a song whose tempo may change.
+    Each tempo change is stored with the tick it happens at and the number of seconds
+    which have passed by then, so converting a tick only needs the tempo change before it.
+    """
+
+    def __init__(self, resolution, tempo_changes=()):
+        """tempo_changes is a list of (tick, tempo_bpm) pairs. Songs start at DEFAULT_TEMPO_BPM."""
+        self.resolution = resolution
+
+        # When several changes happen on the same tick, the one read last is kept
+        changes = {0: DEFAULT_TEMPO_BPM}
+        for tick, tempo_bpm in sorted(tempo_changes, key=lambda change: change[0]):
+            changes[tick] = tempo_bpm
+
+        self.ticks = np.array(list(changes.keys()), dtype=np.int64)
+        self.tempo_bpm = np.array(list(changes.values()), dtype=np.float64)
+
+        seconds_per_tick = 60.0 / (self.tempo_bpm * resolution)
+        section_durations = np.diff(self.ticks) * seconds_per_tick[:-1]
+        self.seconds = np.concatenate([[0.0], np.cumsum(section_durations)])
+        self.seconds_per_tick = seconds_per_tick
+
+    def __repr__(self):
+        return f"TempoMap({len(self.ticks)} tempos)"
+
+    def ticks_to_seconds(self, ticks):
+        """Converts a tick, or an array of ticks, into seconds from the start of the song."""
+        ticks = np.asarray(ticks, dtype=np.float64)
+        changes = np.searchsorted(self.ticks, ticks, side="right") - 1
+        changes = np.maximum(changes, 0)
+        return self.seconds[changes] + (ticks - self.ticks[changes]) * self.seconds_per_tick[changes]
+
+    def beats_to_seconds(self, beats):
+        """Converts a number of crotchet beats from the start of the song into seconds."""
+        return self.ticks_to_seconds(np.asarray(beats, dtype=np.float64) * self.resolution)
+
+    def get_tempo_bpm_at(self, seconds):
+        """Returns the tempo which the song is playing at after the given number of seconds."""
+        change = max(np.searchsorted(self.seconds, seconds, side="right") - 1, 0)
+        return float(self.tempo_bpm[change])
+
+def get_beat_and_bar_ticks(time_signatures, resolution, end_tick):
+    """
+    Returns the ticks at which every beat and every bar starts, up to and including end_tick.
+    time_signatures is a list of (tick, numerator, denominator). A beat lasts one note of the denominator,
+    and the count of beats and bars starts again from every time signature change.
+    """
+    signatures = {0: DEFAULT_TIME_SIGNATURE}
+    for tick, numerator, denominator in sorted(time_signatures):
+        signatures[tick] = (numerator, denominator)
+
+    beat_ticks = []
+    bar_ticks = []
+    section_starts = list(signatures.keys())
+    section_ends = section_starts[1:] + [max(end_tick, 0) + 1]
+    for start, end, (numerator, denominator) in zip(section_starts, section_ends, signatures.values()):
+        ticks_per_beat = resolution * 4 / denominator
+        beat_ticks.append(np.arange(start, end, ticks_per_beat))
+        bar_ticks.append(np.arange(start, end, ticks_per_beat * numerator))
+    return np.concatenate(beat_ticks), np.concatenate(bar_ticks)